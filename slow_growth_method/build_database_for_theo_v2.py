@@ -1,7 +1,9 @@
 import json as js
 import os
+import sys
 import getpass
 import get_mols
+from simulation_database import SimulationDatabase
 
 username=getpass.getuser()
 
@@ -13,20 +15,20 @@ def db_add_key( database, key ):
 		database[ key ] = {}
 
 def db_add( database, key, name, input ):
-	if name in database[ key ].keys():
+	if db_get( database, key, name ) is not None:
 		print ( "ERROR: %s already exit in %s" %(str( name ),  key) )
 		exit()
 	if 'path' not in input.keys():
 		print ( "ERROR: path is required %s" %(input) )
 		exit()
     
-	database[ key ][ name ] = input 
+	db_set( database, key, name, input )
 
 def db_update( database, key, name, input ):
 	if 'path' not in input.keys():
 		print ( "ERROR: path is required %s" %(input) )
 		exit()
-	if name not in database[ key ].keys():
+	if db_get( database, key, name ) is None:
 		print ( "ERROR: %s does not exit in %s" %(str( name ),  key) )
 		exit()
 
@@ -34,22 +36,73 @@ def db_update( database, key, name, input ):
 		print ( "ERROR: %s does not exit" %( key) )
 		exit()
 
-	database[ key ][ name ] = input
+	db_set( database, key, name, input )
 
+# database: Either the dictionary of database_for_theo.js or a SimulationDatabase.
+def db_set( database, key, name, input ):
+	if isinstance( database, SimulationDatabase ):
+		database.upsert( key, name, input )
+	else:
+		database[ key ][ name ] = input
+
+#A SimulationDatabase commits the pending changes in one transaction, fout is its own file
 def db_save( database, fout ):
+	if isinstance( database, SimulationDatabase ):
+		database.commit()
+		return
 	with open( fout, 'w' ) as f:
 		js.dump( database, f, indent = 4 )
 
 def db_load( database, fin ):
 	with open( fin, 'r' ) as f:
-		database  = js.load( f )
+		loaded = js.load( f )
+	database.clear()
+	database.update( loaded )
+	return database
+
+# Returns the entry name of category key, or None if it does not exist.
+def db_get( database, key, name ):
+	if isinstance( database, SimulationDatabase ):
+		return database.get( key, name )
+	return database.get( key, {} ).get( name )
+
+def db_delete( database, key, name ):
+	if isinstance( database, SimulationDatabase ):
+		database.delete( key, name )
+	else:
+		del database[ key ][ name ]
+
+#Removes the entries of category key whose simulation directory was deleted or renamed, i.e. whose name is not in names.
+#Only the entries selected by keep ( a function of the name ) are considered, so categories filled by several calls keep the entries of the others.
+def db_prune( database, key, names, keep = lambda name: True ):
+	for name in [ x for x in database[ key ].keys() if keep( x ) and x not in names ]:
+		print ( "%s no longer exists, removed from %s" %( name, key ) )
+		db_delete( database, key, name )
 
 def convert( path ):
 	return path.replace( '~', '/home/' + username )
 
-def add_to_database( loc, key, folders, note = "" ):
+# Fingerprint of the files get_status looks at: the number of RUNs, the latest RUN directory and its CONTCAR and ICONST.
+# Any new RUN, rewritten CONTCAR or changed ICONST changes the fingerprint.
+def get_fingerprint( runs, loc_status, loc_contcar ):
+	fingerprint = [ len( runs ) ]
+	for f in [ loc_status, loc_contcar, loc_status + "/ICONST" ]:
+		if os.path.exists( f ):
+			stat = os.stat( f )
+			fingerprint += [ stat.st_size, stat.st_mtime_ns ]
+		else:
+			fingerprint += [ None, None ]
+	return fingerprint
+
+# incremental: if True, entries already in the database whose fingerprint did not change are kept as they are,
+#              changed entries are re-evaluated with db_update and only new entries are added with db_add.
+#              Entries whose directory no longer exists are removed ( see db_prune ).
+# save: if False, the database is not written; the caller saves it once at the end with db_save.
+def add_to_database( loc, key, folders, note = "", incremental = False, save = True ):
 	db_add_key( database, key )
-	for name in [ x for x in os.listdir( convert( loc ) ) if folders in x ]:
+	names = [ x for x in os.listdir( convert( loc ) ) if folders in x ]
+	db_prune( database, key, names, lambda name: folders in name )
+	for name in names:
 		path = loc + name
 		loc_ = convert( loc )  +  name 
 		runs = get_mols.get_RUNs( loc_ )
@@ -58,62 +111,83 @@ def add_to_database( loc, key, folders, note = "" ):
 		if not runs:
 			loc_contcar = loc_ + "/CONTCAR" 
 			loc_status = loc_ 
+		fingerprint = get_fingerprint( runs, loc_status, loc_contcar )
+		entry = db_get( database, key, name ) if incremental else None
+		exists = entry is not None
+		if exists and entry.get( 'fingerprint' ) == fingerprint:
+			continue
 		note = "Bad"
 		if ( os.path.isfile( loc_contcar ) ) == True:
 			status = get_mols.get_status( loc_status )
 			if status == True:
 				note = "Good"
-			input = { 'path': loc_, 'note': note }
-			db_add( database, key, name, input )
+		input = { 'path': loc_, 'note': note, 'fingerprint': fingerprint }
+		if exists:
+			db_update( database, key, name, input )
 		else:
-			input = { 'path': loc_, 'note': note }
 			db_add( database, key, name, input )
-	db_save( database, 'database_for_theo.js' )
+	if save:
+		db_save( database, 'database_for_theo.js' )
 
 #for relaxed systems and MD with and without Voltage for reaching stability
-def add_to_database_v2( loc, key ):
+#incremental: if True, entries already in the database are kept as they are; those whose directory no longer exists are removed
+def add_to_database_v2( loc, key, incremental = False, save = True ):
 	db_add_key( database, key )
-	for name in [ x for x in os.listdir( convert( loc ) ) if os.path.isdir( convert( loc ) +  "/" + x )  ]:
+	names = [ x for x in os.listdir( convert( loc ) ) if os.path.isdir( convert( loc ) +  "/" + x )  ]
+	db_prune( database, key, names )
+	for name in names:
+		if incremental and db_get( database, key, name ) is not None:
+			continue
 		path = loc + name
 		input = { 'path': path, 'note': "" }
 		db_add( database, key, name, input )
-	db_save( database, 'database_for_theo.js' )
+	if save:
+		db_save( database, 'database_for_theo.js' )
 
 if __name__ == "__main__":
-	database = {}        
+	#The entries are kept in an SQLite store; database_for_theo.js is still written at the end for the scripts that read the JSON file
+	database_file = 'database_for_theo.db'
+	json_file = 'database_for_theo.js'
+	#Re-evaluate only new or changed entries of an existing database; run with --full to rebuild it from scratch
+	incremental = "--full" not in sys.argv
+	database = SimulationDatabase( database_file )
+	if not incremental:
+		database.clear()
+	elif not database.keys() and os.path.isfile( json_file ):
+		database.import_json( json_file )
 	
 	K_relax = "/home/theodoros/PROJ_ElectroCat/theodoros/HER/Au/HER_Au/relaxation/K"
-	add_to_database_v2( K_relax, "K_relax" )	
+	add_to_database_v2( K_relax, "K_relax", incremental = incremental, save = False )
 
 	Na_relax = "/home/theodoros/PROJ_ElectroCat/theodoros/HER/Au/HER_Au/relaxation/Na"
-	add_to_database_v2( Na_relax, "Na_relax" )
+	add_to_database_v2( Na_relax, "Na_relax", incremental = incremental, save = False )
 
 	NH4_relax = "/home/theodoros/PROJ_ElectroCat/theodoros/HER/Au/HER_Au/relaxation/NH4"
-	add_to_database_v2( NH4_relax, "NH4_relax" )
+	add_to_database_v2( NH4_relax, "NH4_relax", incremental = incremental, save = False )
 
 	CH3NH3_relax = "/home/theodoros/PROJ_ElectroCat/theodoros/HER/Au/HER_Au/relaxation/CH3NH3"
-	add_to_database_v2( CH3NH3_relax, "CH3NH3_relax" )
+	add_to_database_v2( CH3NH3_relax, "CH3NH3_relax", incremental = incremental, save = False )
 
 	Na_MD = "/home/theodoros/PROJ_ElectroCat/theodoros/HER/Au/HER_Au/MD/Na"
-	add_to_database_v2( Na_MD, "Na_MD" )
+	add_to_database_v2( Na_MD, "Na_MD", incremental = incremental, save = False )
 	
 	K_MD = "/home/theodoros/PROJ_ElectroCat/theodoros/HER/Au/HER_Au/MD/K"
-	add_to_database_v2( K_MD, "K_MD" )
+	add_to_database_v2( K_MD, "K_MD", incremental = incremental, save = False )
 	
 	NH4_MD = "/home/theodoros/PROJ_ElectroCat/theodoros/HER/Au/HER_Au/MD/NH4"
-	add_to_database_v2( NH4_MD, "NH4_MD" )
+	add_to_database_v2( NH4_MD, "NH4_MD", incremental = incremental, save = False )
 
 	CH3NH3_MD = "/home/theodoros/PROJ_ElectroCat/theodoros/HER/Au/HER_Au/MD/CH3NH3"
-	add_to_database_v2( CH3NH3_MD, "CH3NH3_MD" )
+	add_to_database_v2( CH3NH3_MD, "CH3NH3_MD", incremental = incremental, save = False )
 
 	Na_MD_voltage = "/home/theodoros/PROJ_ElectroCat/theodoros/HER/Au/HER_Au/MD_voltage/Na"
-	add_to_database_v2( Na_MD_voltage, "Na_MD_voltage" )
+	add_to_database_v2( Na_MD_voltage, "Na_MD_voltage", incremental = incremental, save = False )
 
 	NH4_MD_voltage = "/home/theodoros/PROJ_ElectroCat/theodoros/HER/Au/HER_Au/MD_voltage/NH4"
-	add_to_database_v2( NH4_MD_voltage, "NH4_MD_voltage" )
+	add_to_database_v2( NH4_MD_voltage, "NH4_MD_voltage", incremental = incremental, save = False )
 
 	CH3NH3_MD_voltage = "/home/theodoros/PROJ_ElectroCat/theodoros/HER/Au/HER_Au/MD_voltage/CH3NH3"
-	add_to_database_v2( CH3NH3_MD_voltage, "CH3NH3_MD_voltage" )
+	add_to_database_v2( CH3NH3_MD_voltage, "CH3NH3_MD_voltage", incremental = incremental, save = False )
 
 
 	base_Na = "~/PROJ_ElectroCat/theodoros/HER/Au/HER_Au/slow_grow_method/Na/"
@@ -121,25 +195,29 @@ if __name__ == "__main__":
 	Na_key_HashMap = { "A" : "_Na_H2O_dissociation_NOT_from_hydration_shell", "B" : "_Na_H2O_dissociation_from_hydration_shell" }
 	Na_name = "_Na_40_H2O_v"
 	for i in [ 1, 3, 5 ]:
-		add_to_database( base_Na + str( i ) + "_Na" + Na_NashMap[ "A" ], str( i ) + Na_key_HashMap[ "A" ],  str( i ) + Na_name )
-		add_to_database( base_Na + str( i ) + "_Na" + Na_NashMap[ "B" ], str( i ) + Na_key_HashMap[ "B" ],  str( i ) + Na_name )
+		add_to_database( base_Na + str( i ) + "_Na" + Na_NashMap[ "A" ], str( i ) + Na_key_HashMap[ "A" ],  str( i ) + Na_name, incremental = incremental, save = False )
+		add_to_database( base_Na + str( i ) + "_Na" + Na_NashMap[ "B" ], str( i ) + Na_key_HashMap[ "B" ],  str( i ) + Na_name, incremental = incremental, save = False )
 
 	base_NH4 = "~/PROJ_ElectroCat/theodoros/HER/Au/HER_Au/slow_grow_method/NH4/"
 	NH4_HashMap = { "A" : "/H2O_splitting_from_NH4_hydration_shell/",  "B" :  "/H2O_splitting_NOT_from_NH4_hydration_shell/", "C" : "/NH4_splitting/", "D" : "/shuttling/" }
 	NH4_key_HashMap = { "A" : "_NH4_H2O_dissociation_from_hydration_shell", "B" : "_NH4_H2O_dissociation_NOT_from_hydration_shell", "C" :"_NH4_spliting", "D" : "_NH4_shuttling" }
 	NH4_name = "_NH4_40_H2O_v"
 	for i in [ 1, 3, 5 ]:
-		add_to_database( base_NH4 + str( i ) + "_NH4" + NH4_HashMap[ "A" ], str( i ) + NH4_key_HashMap[ "A" ],  str( i ) + NH4_name )
-		add_to_database( base_NH4 + str( i ) + "_NH4" + NH4_HashMap[ "B" ], str( i ) + NH4_key_HashMap[ "B" ],  str( i ) + NH4_name )
-		add_to_database( base_NH4 + str( i ) + "_NH4" + NH4_HashMap[ "C" ], str( i ) + NH4_key_HashMap[ "C" ],  str( i ) + NH4_name )
-		add_to_database( base_NH4 + str( i ) + "_NH4" + NH4_HashMap[ "D" ], str( i ) + NH4_key_HashMap[ "D" ],  str( i ) + NH4_name )
+		add_to_database( base_NH4 + str( i ) + "_NH4" + NH4_HashMap[ "A" ], str( i ) + NH4_key_HashMap[ "A" ],  str( i ) + NH4_name, incremental = incremental, save = False )
+		add_to_database( base_NH4 + str( i ) + "_NH4" + NH4_HashMap[ "B" ], str( i ) + NH4_key_HashMap[ "B" ],  str( i ) + NH4_name, incremental = incremental, save = False )
+		add_to_database( base_NH4 + str( i ) + "_NH4" + NH4_HashMap[ "C" ], str( i ) + NH4_key_HashMap[ "C" ],  str( i ) + NH4_name, incremental = incremental, save = False )
+		add_to_database( base_NH4 + str( i ) + "_NH4" + NH4_HashMap[ "D" ], str( i ) + NH4_key_HashMap[ "D" ],  str( i ) + NH4_name, incremental = incremental, save = False )
 
 	base_CH3NH3 = "~/PROJ_ElectroCat/theodoros/HER/Au/HER_Au/slow_grow_method/CH3NH3/"
 	CH3NH3_HashMap = { "A" : "/H2O_splitting_from_CH3NH3_hydration_shell/",  "B" :  "/H2O_splitting_NOT_from_CH3NH3_hydration_shell/", "C" : "/CH3NH3_splitting/", "D" : "/shuttling/" }
 	CH3NH3_key_HashMap = { "A" : "_CH3NH3_H2O_dissociation_from_hydration_shell", "B" : "_CH3NH3_H2O_dissociation_NOT_from_hydration_shell", "C" :"_CH3NH3_spliting", "D" : "_CH3NH3_shuttling" }
 	CH3NH3_name = "_CH3NH3_40_H2O_v"
 	for i in [ 1, 3, 5 ]:
-		add_to_database( base_CH3NH3 + str( i ) + "_CH3NH3" + CH3NH3_HashMap[ "A" ], str( i ) + CH3NH3_key_HashMap[ "A" ],  str( i ) + CH3NH3_name )
-		add_to_database( base_CH3NH3 + str( i ) + "_CH3NH3" + CH3NH3_HashMap[ "B" ], str( i ) + CH3NH3_key_HashMap[ "B" ],  str( i ) + CH3NH3_name )
-		add_to_database( base_CH3NH3 + str( i ) + "_CH3NH3" + CH3NH3_HashMap[ "C" ], str( i ) + CH3NH3_key_HashMap[ "C" ],  str( i ) + CH3NH3_name )
-		add_to_database( base_CH3NH3 + str( i ) + "_CH3NH3" + CH3NH3_HashMap[ "D" ], str( i ) + CH3NH3_key_HashMap[ "D" ],  str( i ) + CH3NH3_name )
+		add_to_database( base_CH3NH3 + str( i ) + "_CH3NH3" + CH3NH3_HashMap[ "A" ], str( i ) + CH3NH3_key_HashMap[ "A" ],  str( i ) + CH3NH3_name, incremental = incremental, save = False )
+		add_to_database( base_CH3NH3 + str( i ) + "_CH3NH3" + CH3NH3_HashMap[ "B" ], str( i ) + CH3NH3_key_HashMap[ "B" ],  str( i ) + CH3NH3_name, incremental = incremental, save = False )
+		add_to_database( base_CH3NH3 + str( i ) + "_CH3NH3" + CH3NH3_HashMap[ "C" ], str( i ) + CH3NH3_key_HashMap[ "C" ],  str( i ) + CH3NH3_name, incremental = incremental, save = False )
+		add_to_database( base_CH3NH3 + str( i ) + "_CH3NH3" + CH3NH3_HashMap[ "D" ], str( i ) + CH3NH3_key_HashMap[ "D" ],  str( i ) + CH3NH3_name, incremental = incremental, save = False )
+
+	db_save( database, database_file )
+	database.export_json( json_file )
+	database.close()
@@ -1,36 +1,37 @@
 import os
-import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib
-import gzip as gz
-import matplotlib.image as mpimg
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm 
-img = mpimg.imread(  'frame_0.png' )
-ny = img.shape[ 0 ]
-nx = img.shape[ 1 ]
-lx = 4
-ly = lx/nx * ny
+from video import TimeStamp, get_time_text, read_rgb8
 
+# The TimeStamp of every frame width, reused for all frames stamped by a process.
+stamps = {}
+
+def get_step( image_name ):
+    return int( image_name.replace( 'frame_','' ).replace( '.png','' ) )
+
+# Writes outdir/t<image_name>: the frame over a white background with its time label ( see video.TimeStamp ) in the top left corner.
+# The label is blended into the pixels of the frame, so the image keeps its size and is not redrawn by matplotlib.
+# The output is written under a temporary name and renamed, so an interrupted run never leaves a truncated tframe_N.png behind.
 def add_time_stamp( image_name, outdir = 'outdir' ):
-    t = int( image_name.replace( 'frame_','' ).replace( '.png','' ) )
-    fig = plt.figure( figsize = ( lx, ly ) )
-    ax  = fig.add_subplot( 1, 1, 1  )
-    img =  mpimg.imread(  image_name )
-    ax.imshow( img )
-    time_text = str( round( t/1000, 3 ) )
-    if len( time_text ) == 3:
-        time_text += '00'
-    elif len( time_text ) == 4:
-        time_text += '0'
-    ax.text( 1, 1, 't = ' + time_text  + ' ps', color = 'k', fontsize = 12, fontweight = 'bold', va = 'top', ha = 'left', bbox=dict(facecolor='white', edgecolor='none', alpha = 0.3, pad=1.0) )
-    ax.axis( 'off' )
-    plt.subplots_adjust(left=0.0, right=1., top=1, bottom=0.0, wspace=0.00, hspace= 0.00)
+    t = get_step( image_name )
+    img = read_rgb8( image_name )
+    if img.shape[ 1 ] not in stamps:
+        stamps[ img.shape[ 1 ] ] = TimeStamp( img.shape[ 1 ] )
+    stamps[ img.shape[ 1 ] ]( img, get_time_text( t ) )
+    tmp = os.path.join( outdir, '.t' + str( os.getpid( ) ) + '_' + image_name )
+    Image.fromarray( img ).save( tmp, format = 'png' )
+    os.replace( tmp, os.path.join( outdir, 't' + image_name ) )
+    return image_name
+
+if __name__ == "__main__":
+    outdir = 'outdir'
     if not os.path.isdir( outdir ):
         os.mkdir( outdir )
-    plt.savefig( outdir + '/t' + image_name, dpi = 200 )
-    plt.clf()
-    plt.close()
-frames = [ x for x in os.listdir( '.' ) if '.png' in x and 'frame' in x ]
-for image_name in tqdm( frames ):
-    if ( not os.path.isfile( 'outdir/t' + image_name)):
-        add_time_stamp( image_name )
+    frames = sorted( [ x for x in os.listdir( '.' ) if x.startswith( 'frame_' ) and x.endswith( '.png' ) ], key = get_step )
+    #frames with a time stamp already are skipped
+    frames = [ x for x in frames if not os.path.isfile( os.path.join( outdir, 't' + x ) ) ]
+    workers = os.cpu_count()
+    with ProcessPoolExecutor( max_workers = workers ) as executor:
+        for image_name in tqdm( executor.map( add_time_stamp, frames, chunksize = max( 1, len( frames ) // ( 4 * workers ) ) ), total = len( frames ) ):
+            pass
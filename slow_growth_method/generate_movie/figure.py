@@ -7,9 +7,31 @@ from ase.visualize import view
 import matplotlib.cm as cm
 import matplotlib.image as mpimg
 import matplotlib.pyplot as plt
+import os
+import copy
+import functools
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from ase.data import covalent_radii
+from ase.neighborlist import NeighborList
+from raster import render_raster
 
-def get_atom_setting( ):
-    with open( '/shared/apps/VESTA-x86_64/elements.ini', 'r' ) as f:
+ELEMENTS_FILE = '/shared/apps/VESTA-x86_64/elements.ini'
+
+# Hydrogen bonds drawn by get_figure_2: ( atype1, atype2, radius, rhbondrange ) of every get_hydrogenbonds call.
+HYDROGENBONDS = [
+    ( 'Na', [ 'O', 'S' ], 4, ( 2.3, 4.0 ) ),
+    ( 'H', [ 'O', 'S', 'N' ], 5, ( 1.3, 2.6 ) ),
+    ( 'He', [ 'O', 'S', 'N' ], 5, ( 1.3, 2.6 ) ),
+    #( 'K', [ 'O', 'S' ], 2, ( 1.3, 3.0 ) ),
+    ]
+HYDROGENBOND_STYLE = { 'ndots':5, 'color' : [0., 1, 0.], 'rdot':0.05 }
+HYDROGENBOND_ELEMENTS = set( [ x[ 0 ] for x in HYDROGENBONDS ] + [ y for x in HYDROGENBONDS for y in x[ 1 ] ] )
+
+# The element table is parsed only once per process; get_atom_setting returns a copy, so callers can modify it.
+@functools.lru_cache( maxsize = None )
+def read_atom_setting( filename = ELEMENTS_FILE ):
+    with open( filename, 'r' ) as f:
         lines = f.readlines( )
     elements = { }
     for line in lines:
@@ -26,6 +48,91 @@ def get_atom_setting( ):
         elements[ element ][ 'color' ] = color
     return elements
 
+def get_atom_setting( ):
+    return copy.deepcopy( read_atom_setting( ) )
+
+# The elements of get_figure_2: VESTA's table with the colors and covalent radii changed for the marked atoms.
+def get_figure_elements( ):
+    elements = get_atom_setting( )
+    elements[ 'S' ][ 'color' ] = ( 1, 0, 0 )
+    elements[ 'O' ][ 'color' ] = ( 1, 0.7, 0.7 )
+    elements[ 'H' ][ 'color' ] = ( 1, 1, 1 )
+    elements[ 'He' ][ 'color' ] = ( 1, 0, 1 )
+    elements[ 'S' ][ 'rcov' ] = elements[ 'O' ][ 'rcov' ]
+    elements[ 'He' ][ 'rcov' ] = elements[ 'H' ][ 'rcov' ]
+    elements[ 'C' ][ 'rcov' ] = elements[ 'O' ][ 'rcov' ]
+    elements[ 'Na' ][ 'rcov' ] = elements[ 'Na' ][ 'rcov' ] * 0.6
+    return elements
+
+# Everything get_figure_2 sets up besides the positions, kept between the frames of a trajectory.
+# - The element table is read once, and the radii and colors are only rebuilt when the chemical symbols change ( which also rebuilds the neighbor list ).
+# - The bonds come from a neighbor list with an extra skin: it is only rebuilt when an atom moved more than skin since the last build,
+#   otherwise the candidate pairs are filtered by their current length. The bonds are the same as those of get_bondpairs( system, radius ).
+# - The hydrogen bonds are searched among the atoms of the HYDROGENBONDS elements only.
+# Usage: template = SceneTemplate( ), then get_figure_2( img, fout, template = template ) for every frame.
+class SceneTemplate:
+    def __init__( self, radius = 0.6, skin = 0.5 ):
+        self.elements = get_figure_elements( )
+        self.radius = radius
+        self.skin = skin
+        self.numbers = None
+        self.nl = None
+
+    # Sets radii and colors ( lists over the atoms ), following the per-atom rules of get_figure_2.
+    def set_styles( self, system ):
+        symbols = system.get_chemical_symbols( )
+        table = { }
+        for symbol in set( symbols ):
+            radius = self.elements[ symbol ][ 'rcov' ]
+            if symbol in [ 'O', 'H', 'S', 'He', 'N' ]:
+                radius = radius/3.
+            color = self.elements[ symbol ][ 'color' ]
+            alpha = 0
+            if symbol in [ 'C', 'S', 'K' ]:
+                alpha =1 
+            table[ symbol ] = ( radius, ( color[ 0 ], color[ 1 ], color[ 2 ], alpha ) )
+        self.radii = [ table[ x ][ 0 ] for x in symbols ]
+        self.colors = [ table[ x ][ 1 ] for x in symbols ]
+        self.hbond_index = np.array( [ i for i, x in enumerate( symbols ) if x in HYDROGENBOND_ELEMENTS ], dtype = int )
+
+    # Returns the bond pairs of get_bondpairs( system, self.radius ), updating the neighbor list only when needed.
+    def get_bondpairs( self, system ):
+        if self.nl is None:
+            # get_bondpairs uses NeighborList's default skin of 0.3, which is kept as part of the bond length
+            self.cutoffs = self.radius * covalent_radii[ system.numbers ] + 0.3
+            self.nl = NeighborList( cutoffs = self.cutoffs, skin = self.skin, self_interaction = False )
+        if self.nl.update( system ):
+            first, second, offsets = [ ], [ ], [ ]
+            for a in range( len( system ) ):
+                indices, offset = self.nl.get_neighbors( a )
+                first.append( np.full( len( indices ), a ) )
+                second.append( indices )
+                offsets.append( offset )
+            self.candidates = ( np.concatenate( first ), np.concatenate( second ), np.concatenate( offsets ).reshape( -1, 3 ) )
+        first, second, offsets = self.candidates
+        vectors = system.positions[ second ] + offsets @ system.cell.array - system.positions[ first ]
+        keep = np.linalg.norm( vectors, axis = 1 ) < self.cutoffs[ first ] + self.cutoffs[ second ]
+        return [ ( a, b, offset ) for a, b, offset in zip( first[ keep ], second[ keep ], offsets[ keep ] ) ]
+
+    # Returns the merged hydrogen bonds of HYDROGENBONDS, computed on the atoms that can form them and mapped back to the indices of system.
+    def get_hydrogenbonds( self, system ):
+        subsystem = system[ self.hbond_index ]
+        hydrogenbond = { }
+        for atype1, atype2, radius, rhbondrange in HYDROGENBONDS:
+            for key, value in get_hydrogenbonds( subsystem, atype1 = atype1, atype2 = atype2, radius = radius, rhbondrange = rhbondrange ).items( ):
+                hydrogenbond[ ( self.hbond_index[ key[ 0 ] ], self.hbond_index[ key[ 1 ] ] ) ] = value
+        return hydrogenbond
+
+    # Returns radii, colors and bond pairs ( with the hydrogen bonds set ) for system.
+    def update( self, system ):
+        if self.numbers is None or not np.array_equal( system.numbers, self.numbers ):
+            self.set_styles( system )
+            self.nl = None
+            self.numbers = system.numbers.copy( )
+        bond_pairs = self.get_bondpairs( system )
+        bond_pairs = set_high_bondorder_pairs( bond_pairs, high_bondorder_pairs = self.get_hydrogenbonds( system ) )
+        return self.radii, self.colors, bond_pairs
+
 def get_figure( sys0, fout, rot = "-30x", w = 12, h = 11, alpha_top = 0.5, alpha_bot = 0.5 ):
     system  = supercell( sys0, 1, 3, 1 )
     center = 0.5 * system.cell[ 0 ] + 0.5* system.cell[ 1 ] + 0.5* system.cell[ 2 ]
@@ -81,7 +188,11 @@ def get_figure( sys0, fout, rot = "-30x", w = 12, h = 11, alpha_top = 0.5, alpha
     plt.savefig( fout + '.png', dpi = 600 )
     
 
-def get_figure_2( sys0, fout, rot = "-30x", w = 15, h = 15 ):
+# Builds the scene of get_figure_2: the 3x1x1 supercell of sys0, shifted so that 1.8 a + 0.5 b + 0.5 c of sys0 is at the origin,
+# with the radii, colors and bond pairs of its atoms.
+# template: A SceneTemplate reused between calls ( e.g. the frames of a trajectory ). Default is None, which sets up everything for this call only.
+# Returns: system, radii, colors, bond_pairs
+def get_scene( sys0, template = None ):
     system  = supercell( sys0, 3, 1, 1 )
     center = 1.8*sys0.cell[ 0 ] + 0.5*sys0.cell[ 1 ] + 0.5* sys0.cell[ 2 ]	
     #center = 1.5*sys0.cell[ 0 ] + 0.5*sys0.cell[ 1 ] + 0.5* sys0.cell[ 2 ]
@@ -93,47 +204,12 @@ def get_figure_2( sys0, fout, rot = "-30x", w = 15, h = 15 ):
     for i in range( 3 ):
         system.positions[ :, i ] -= center[ i ]
     
-    elements = get_atom_setting( )
-    elements[ 'S' ][ 'color' ] = ( 1, 0, 0 )
-    elements[ 'O' ][ 'color' ] = ( 1, 0.7, 0.7 )
-    elements[ 'H' ][ 'color' ] = ( 1, 1, 1 )
-    elements[ 'He' ][ 'color' ] = ( 1, 0, 1 )
-    elements[ 'S' ][ 'rcov' ] = elements[ 'O' ][ 'rcov' ]
-    elements[ 'He' ][ 'rcov' ] = elements[ 'H' ][ 'rcov' ]
-    elements[ 'C' ][ 'rcov' ] = elements[ 'O' ][ 'rcov' ]
-    elements[ 'Na' ][ 'rcov' ] = elements[ 'Na' ][ 'rcov' ] * 0.6
-
-    radii = [ ]
-    colors = [ ]
-    for i, at in enumerate( system ):
-        radius = elements[ at.symbol ][ 'rcov' ]
-        if at.symbol in [ 'O', 'H', 'S', 'He', 'N' ]:
-            radius = radius/3.
-        radii.append( radius )
-        color = elements[ at.symbol ][ 'color' ]
-        alpha = 0
-        if at.symbol in [ 'C', 'S', 'K' ]:
-            alpha =1 
-        factor = 0
-        colors.append( ( factor + color[ 0 ], factor + color[ 1 ], factor + color[ 2 ], alpha ) )
-
-
-    bond_pairs = get_bondpairs( system, radius = 0.6 )
-    hydrogenbond1 = get_hydrogenbonds( system, atype1 = 'Na', atype2= [ 'O', 'S' ], radius = 4, rhbondrange = (2.3, 4.0) )
-
-    hydrogenbond2 = get_hydrogenbonds( system, atype1 = 'H', atype2= [ 'O', 'S', 'N' ], radius = 5, rhbondrange = (1.3, 2.6) )
-    hydrogenbond3 = get_hydrogenbonds( system, atype1 = 'He', atype2= [ 'O', 'S', 'N' ], radius = 5, rhbondrange = (1.3, 2.6) )
-    #hydrogenbond2 = get_hydrogenbonds( system, atype1 = 'K', atype2= [ 'O', 'S' ], radius = 2, rhbondrange = (1.3, 3.0) )
-    hydrogenbond  = {}
-    for key in hydrogenbond1.keys():
-        hydrogenbond[ key ] = hydrogenbond1[ key ]
-    for key in hydrogenbond2.keys():
-        hydrogenbond[ key ] = hydrogenbond2[ key ]
-    for key in hydrogenbond3.keys():
-        hydrogenbond[ key ] = hydrogenbond3[ key ]
-
-    bond_pairs = set_high_bondorder_pairs(bond_pairs, high_bondorder_pairs=hydrogenbond)
+    if template is None:
+        template = SceneTemplate( )
+    radii, colors, bond_pairs = template.update( system )
+    return system, radii, colors, bond_pairs
 
+def get_bbox( w, h ):
     width  = w
     height = h
     bbox = (
@@ -142,9 +218,13 @@ def get_figure_2( sys0, fout, rot = "-30x", w = 15, h = 15 ):
            width/2,
            height/2-2.5,
            )
+    return bbox
+
+# Writes the POV-Ray scene fout.pov ( and fout.ini ) of a scene of get_scene, and renders fout.png if run_povray.
+def write_pov( system, fout, radii, colors, bond_pairs, bbox, rot, run_povray = True ):
     #for rotx in [ 0, 15, 30, 45, 60, 75, 90 ]:
     #    rot = '90z,' + str( rotx ) + 'x' 
-    write( fout+ '.pov', system, format = 'pov', run_povray = True,
+    write( fout+ '.pov', system, format = 'pov', run_povray = run_povray,
            canvas_width = 1000,    # Set width, in pixel
            radii = radii,              # Set radius 
            bondatoms = bond_pairs, # Display bonds
@@ -152,8 +232,51 @@ def get_figure_2( sys0, fout, rot = "-30x", w = 15, h = 15 ):
            colors = colors,        # Set colors
            celllinewidth = 0.0,
            rotation = rot,
-           hydrogenbond = { 'ndots':5, 'color' : [0., 1, 0.], 'rdot':0.05 }
+           hydrogenbond = HYDROGENBOND_STYLE
            )
+
+# template: See get_scene.
+# backend: 'pov' renders fout.png with POV-Ray ( for publication frames ). 'raster' draws a preview with raster.render_raster in memory,
+#          50-100 times faster, and writes it to fout.png unless fout is None.
+# Returns: The image as a ( height, width, 4 ) array for the 'raster' backend, otherwise None.
+def get_figure_2( sys0, fout, rot = "-30x", w = 15, h = 15, template = None, backend = 'pov' ):
+    system, radii, colors, bond_pairs = get_scene( sys0, template )
+    bbox = get_bbox( w, h )
+    if backend == 'raster':
+        image = render_raster( system, radii, colors, bond_pairs, bbox = bbox, rotation = rot, canvas_width = 1000, hydrogenbond = HYDROGENBOND_STYLE )
+        if fout is not None:
+            plt.imsave( fout + '.png', image )
+        return image
+    write_pov( system, fout, radii, colors, bond_pairs, bbox, rot )
+
+# Renders sys0 as get_figure_2 for several rotations ( e.g. an angle scan to pick the best view ), building the scene only once:
+# the supercell, styles and bonds are shared by all views, and only the projection is done per rotation.
+# - 'pov': The scene files of all views are written first, then POV-Ray renders them concurrently, one process per view.
+# - 'raster': The views are drawn in parallel processes.
+# fouts: The output names, one per rotation ( fout.png is written; None skips writing for the 'raster' backend ).
+# rotations: The rotation strings.
+# workers: The number of views rendered at the same time. Default is None, which uses all available cores.
+# Returns: The list of images for the 'raster' backend, otherwise None.
+def get_figures_2( sys0, fouts, rotations, w = 15, h = 15, template = None, backend = 'pov', workers = None ):
+    system, radii, colors, bond_pairs = get_scene( sys0, template )
+    bbox = get_bbox( w, h )
+    n = len( rotations )
+    if backend == 'raster':
+        with ProcessPoolExecutor( max_workers = workers ) as executor:
+            images = list( executor.map( render_raster, [ system ] * n, [ radii ] * n, [ colors ] * n, [ bond_pairs ] * n, [ bbox ] * n, rotations,
+                                         [ 1000 ] * n, [ 0.10 ] * n, [ HYDROGENBOND_STYLE ] * n ) )
+        for fout, image in zip( fouts, images ):
+            if fout is not None:
+                plt.imsave( fout + '.png', image )
+        return images
+    for fout, rot in zip( fouts, rotations ):
+        write_pov( system, fout, radii, colors, bond_pairs, bbox, rot, run_povray = False )
+    with ThreadPoolExecutor( max_workers = workers or os.cpu_count( ) ) as executor:
+        list( executor.map( render_pov, fouts ) )
+
+# Runs POV-Ray on fout.ini ( written by write_pov ), which renders fout.png.
+def render_pov( fout ):
+    subprocess.run( [ 'povray', fout + '.ini' ], check = True, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL )
     
 
 if __name__ == "__main__":
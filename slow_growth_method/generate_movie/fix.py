@@ -1,41 +1,97 @@
+import os
+import re
+import sys
+import gzip
+import shutil
 import string
+import tempfile
 
-def is_printable(line):
-    if not line.strip():
-        return True
-    threshold = 0.8
-    printable_chars = set(string.printable)
-    num_printable = sum(1 for char in line if char in printable_chars)
-    return (num_printable / max(len(line), 1)) >= threshold
-
-def clean_outcar(filename="OUTCAR"):
-    try:
-        with open(filename, "r", encoding="latin-1", errors="replace") as file:
-            lines = file.readlines()
+# Bytes counted as printable ( string.printable ), used with bytes.translate to count the non-printable bytes of a line in C.
+PRINTABLE_BYTES = string.printable.encode( 'ascii' )
+# The keywords after which VASP sometimes writes a line of binary garbage.
+KEYWORDS = re.compile( rb'SIGMA_RC_K|CORE_C' )
 
-        keywords = {"SIGMA_RC_K", "CORE_C"}
-        removed_anything = False
+def is_printable( line, threshold = 0.8 ):
+    line = line.strip()
+    if not line:
+        return True
+    num_printable = len( line ) - len( line.translate( None, PRINTABLE_BYTES ) )
+    return ( num_printable / len( line ) ) >= threshold
 
-        for i in range( len( lines ) - 1 ):
-            if any( keyword in lines[ i ] for keyword in keywords ):
-                next_line = lines[ i + 1 ].strip()
+# Removes the non-printable line following every keyword line of a block of complete lines.
+# data: Bytes ending at a line boundary ( or at the end of the file ).
+# Returns: The cleaned bytes and the list of removed lines.
+def clean_block( data ):
+    out = []
+    removed = []
+    pos = 0
+    for match in KEYWORDS.finditer( data ):
+        if match.start() < pos:
+            continue
+        start = data.find( b'\n', match.end() ) + 1
+        if start == 0:
+            break
+        end = data.find( b'\n', start )
+        end = len( data ) if end == -1 else end + 1
+        next_line = data[ start:end ]
+        if next_line and not is_printable( next_line ):
+            out.append( data[ pos:start ] )
+            removed.append( next_line )
+            pos = end
+    out.append( data[ pos: ] )
+    return b''.join( out ), removed
 
-                if is_printable(next_line):
-                    print( "No changes to be done" )
-                else:
-                    print( f"Removing: {repr(next_line)}" )
-                    lines[ i + 1 ] = ""
-                    removed_anything = True
+# Returns the position where a chunk can be cut so that every keyword line stays in the same block as the line after it.
+def get_cut( data ):
+    cut = data.rfind( b'\n' ) + 1
+    previous = data.rfind( b'\n', 0, max( cut - 1, 0 ) ) + 1
+    if KEYWORDS.search( data, previous, cut ):
+        return previous
+    return cut
 
-        if removed_anything:
-            with open( filename, "w", encoding = "latin-1" ) as cleaned_file:
-                cleaned_file.writelines( lines )
-            print("\n Cleaned file saved in 'OUTCAR' (original file overwritten).")
+# Cleans an OUTCAR or OUTCAR.gz in fixed-size binary chunks, so 5-10 GB files are handled in bounded memory.
+# - After every line containing SIGMA_RC_K or CORE_C, the next line is removed if less than 80% of its characters are printable.
+# - The cleaned file is written to a temporary file in the same directory ( gzip-compressed for .gz inputs ) and renamed over the original at the end.
+#   If nothing was removed, the original is left untouched.
+# filename: The OUTCAR or OUTCAR.gz file. Default is "OUTCAR" ( or "OUTCAR.gz" if there is no OUTCAR ).
+# chunk_size: The number of bytes read at a time. Default is 16 MB.
+# Returns: The number of removed lines.
+def clean_outcar( filename = "OUTCAR", chunk_size = 1 << 24 ):
+    if not os.path.isfile( filename ) and os.path.isfile( filename + ".gz" ):
+        filename = filename + ".gz"
+    if not os.path.isfile( filename ):
+        print( f"Error: The file '{filename}' was not found." )
+        return 0
+    opener = gzip.open if filename.endswith( ".gz" ) else open
+    directory = os.path.dirname( os.path.abspath( filename ) )
+    fd, tmp = tempfile.mkstemp( dir = directory, prefix = ".fix_" )
+    os.close( fd )
+    removed = 0
+    try:
+        with opener( filename, "rb" ) as fin, ( gzip.open( tmp, "wb", compresslevel = 6 ) if filename.endswith( ".gz" ) else open( tmp, "wb" ) ) as fout:
+            carry = b''
+            while True:
+                chunk = fin.read( chunk_size )
+                data = carry + chunk
+                cut = len( data ) if not chunk else get_cut( data )
+                block, lines = clean_block( data[ :cut ] )
+                carry = data[ cut: ]
+                fout.write( block )
+                for line in lines:
+                    print( f"Removing: {line.strip()!r}" )
+                removed += len( lines )
+                if not chunk:
+                    break
+        if removed:
+            shutil.copymode( filename, tmp )
+            os.replace( tmp, filename )
+            print( f"\n Cleaned file saved in '{filename}' (original file overwritten)." )
         else:
-            print("\n Nothing to remove. 'OUTCAR' remains unchanged." )
-    except FileNotFoundError:
-        print(f"Error: The file '{filename}' was not found." )
-    except Exception as e:
-        print(f"An error occurred: {e}" )
+            print( f"\n Nothing to remove. '{filename}' remains unchanged." )
+    finally:
+        if os.path.exists( tmp ):
+            os.remove( tmp )
+    return removed
 
-clean_outcar()
+if __name__ == "__main__":
+    clean_outcar( sys.argv[ 1 ] if len( sys.argv ) > 1 else "OUTCAR" )
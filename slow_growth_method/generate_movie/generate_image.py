@@ -1,85 +1,159 @@
 import data
 import os
-import matplotlib.pyplot as plt
-from ase.io.trajectory import Trajectory
+import sys
+import glob
+import shutil
+import tempfile
+from itertools import islice
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from ase.io import read
-import json as js
-import numpy as np
-from figure import get_figure_2
-
-os.system( "rm -rf frame_*" )
-loc = os.getcwd() + "/"
-dirs = data.get_dirs()
-dirs = [ loc + x for x in dirs ]
-count = -1
+from trajectory_store import TrajectoryStore
+from figure import get_figure_2, SceneTemplate
+from video import write_video, to_rgb8
+
 step  = 25
 start = -1
+workers = os.cpu_count()
+
+# Marks the atoms of interest with other elements ( so they get their own colors ) and moves atom 64 to the center of the cell.
+def prepare_frame( img, system, idx1, idx2 ):
+    ref = img[ 64 ].position * 1.
+    #img[ 103 ].symbol = 'S'
+    #img[ 181 ].symbol = 'He'
+    #img[ 178 ].symbol = 'He'
+    img[ 189 ].symbol = 'He'
+    img[ 190 ].symbol = 'He'
+    img[ 191 ].symbol = 'He'
+    img[ 192 ].symbol = 'He'
+
+    img[ 194 ].symbol = 'Ge'
+    img[ 195 ].symbol = 'Ge'
+    img[ 196 ].symbol = 'Ge'
+    img[ 197 ].symbol = 'Ge'
+
+    img[ 184 ].symbol = 'Li'
+    img[ 185 ].symbol = 'Li'
+    img[ 186 ].symbol = 'Li'
+    img[ 187 ].symbol = 'Li'
+
+    img[ idx1 ].symbol = 'He'
+    #img[ 120 ].symbol = 'He'
+    #img[ 74 ].symbol = 'S'
+    if system[ idx2 ].symbol != "N":
+        img[ idx2 ].symbol = 'S'
+
+    center = (img.cell[ 0, : ] + img.cell[ 1, : ] ) /2.
+    center[ 2 ] = 0.
+    img.positions[ :, 0 ] -= ref[ 0 ]
+    img.positions[ :, 1 ] -= ref[ 1 ]
+    img.positions[ :, 0 ] += center[ 0 ]
+    img.positions[ :, 1 ] += center[ 1 ]
+    img.wrap()
+    '''
+    img[79].symbol = 'S'
+    img[80].symbol = 'S'
+    ref = img[ 98 ].position * 1.
+    center = (img.cell[ 0, : ] + img.cell[ 1, : ] ) /2.
+    center[ 2 ] = 0.
+    img.positions[ :, 0 ] -= ref[ 0 ]
+    img.positions[ :, 1 ] -= ref[ 1 ]
+    img.positions[ :, 0 ] += center[ 0 ]
+    img.positions[ :, 1 ] += center[ 1 ]
+    #img.wrap()
+    get_figure_2( img, fout, rot = "0z,-90x", w = 20, h = 20 )
+    '''
+    return img
+
+# Lists the frames to render as ( RUN directory, frame index in the RUN, frame number ) tuples.
+# Frames are numbered continuously over the RUN directories; frame_<number>.png files that already exist are skipped ( if resume ), so an interrupted run resumes.
+def get_jobs( loc, dirs, step, start, resume = True ):
+    count = -1
+    jobs = []
+    for dir in dirs:
+        for i in range( len( TrajectoryStore( dir ) ) ):
+            count += 1
+            if count > start and count % step == 0 and not ( resume and os.path.isfile( loc + 'frame_' + str( count ) + '.png' ) ):
+                jobs.append( ( dir, i, count ) )
+    return jobs
+
+# Per-process state of the rendering workers, set by init_worker.
+worker = {}
+
+def init_worker( loc, idx1, idx2, backend = 'pov' ):
+    worker[ 'loc' ] = loc
+    worker[ 'backend' ] = backend
+    worker[ 'idx1' ] = idx1
+    worker[ 'idx2' ] = idx2
+    worker[ 'system' ] = read( loc + '/RUN1/POSCAR' )
+    worker[ 'stores' ] = {}
+    worker[ 'template' ] = SceneTemplate( )
+
+# Returns frame i of the RUN directory dir, prepared for rendering.
+def get_frame( dir, i ):
+    if dir not in worker[ 'stores' ]:
+        worker[ 'stores' ][ dir ] = TrajectoryStore( dir, convert = False )
+    return prepare_frame( worker[ 'stores' ][ dir ].get_atoms( i ), worker[ 'system' ], worker[ 'idx1' ], worker[ 'idx2' ] )
+
+# Renders one frame inside its own scratch directory and moves the PNG next to the RUN directories.
+# POV-Ray's .pov and .ini files stay in the scratch directory, which is removed afterwards, so workers never delete each other's files.
+def render_frame( job ):
+    dir, i, count = job
+    img = get_frame( dir, i )
+    fout = 'frame_' + str( count )
+    scratch = tempfile.mkdtemp( prefix = '.render_', dir = worker[ 'loc' ] )
+    cwd = os.getcwd()
+    try:
+        os.chdir( scratch )
+        get_figure_2( img, fout, rot = "180z,-80x", w = 13, h = 12, template = worker[ 'template' ], backend = worker[ 'backend' ] )
+        os.replace( fout + '.png', os.path.join( worker[ 'loc' ], fout + '.png' ) )
+    finally:
+        os.chdir( cwd )
+        shutil.rmtree( scratch, ignore_errors = True )
+    return count
+
+# Renders one frame with the raster backend in memory and returns it as uint8 RGB with its frame number, for write_video.
+def render_array( job ):
+    dir, i, count = job
+    image = get_figure_2( get_frame( dir, i ), None, rot = "180z,-80x", w = 13, h = 12, template = worker[ 'template' ], backend = 'raster' )
+    return to_rgb8( image ), count
+
+# Yields the rendered frames of render_array in order, keeping at most window frames in flight:
+# a new frame is submitted only when the oldest one is taken, so finished frames never pile up while ffmpeg encodes.
+def render_arrays( executor, jobs, window ):
+    jobs = iter( jobs )
+    pending = deque( executor.submit( render_array, job ) for job in islice( jobs, window ) )
+    while pending:
+        frame = pending.popleft().result()
+        job = next( jobs, None )
+        if job is not None:
+            pending.append( executor.submit( render_array, job ) )
+        yield frame
+
+if __name__ == "__main__":
+    loc = os.getcwd() + "/"
+    #python generate_image.py --restart renders every frame again
+    #python generate_image.py --preview renders quick previews without POV-Ray ( see raster.py )
+    #python generate_image.py --movie streams previews with the time label straight into MD_preview.mp4, without writing any PNG
+    backend = 'raster' if "--preview" in sys.argv else 'pov'
+    if "--restart" in sys.argv:
+        for f in glob.glob( loc + 'frame_*' ):
+            os.remove( f )
+    dirs = data.get_dirs()
+    dirs = [ loc + x for x in dirs ]
+
+    idx1, idx2, idx3 = data.get_standarized_ICONST_data( loc )
+    print( idx1, idx2, idx3 )
 
-idx1, idx2, idx3 = data.get_standarized_ICONST_data( loc )
-print( idx1, idx2, idx3 )
-
-system = read( loc + '/RUN1/POSCAR' )
-for dir in dirs:
-    with open( dir + '/DATA.js', 'r' ) as f:
-        data = js.load( f )
-    npoints = len( data.keys() )
-    traj = Trajectory( dir + '/MOVIE.traj', 'r' )
-    for i in range( len( traj ) ):
-        count += 1
-        if count > start and count % step == 0:
-            print( count )
-            img = traj[ i ]
-            ref = img[ 64 ].position * 1.
-            #img[ 103 ].symbol = 'S'
-            #img[ 181 ].symbol = 'He'
-            #img[ 178 ].symbol = 'He'
-            img[ 189 ].symbol = 'He'
-            img[ 190 ].symbol = 'He'
-            img[ 191 ].symbol = 'He'
-            img[ 192 ].symbol = 'He'
-            
-            img[ 194 ].symbol = 'Ge'
-            img[ 195 ].symbol = 'Ge'
-            img[ 196 ].symbol = 'Ge'
-            img[ 197 ].symbol = 'Ge'
-            
-            img[ 184 ].symbol = 'Li'
-            img[ 185 ].symbol = 'Li'
-            img[ 186 ].symbol = 'Li'
-            img[ 187 ].symbol = 'Li'
-            
-            img[ idx1 ].symbol = 'He'
-            #img[ 120 ].symbol = 'He'
-            #img[ 74 ].symbol = 'S'
-            if system[ idx2 ].symbol != "N": 
-                img[ idx2 ].symbol = 'S'
-
-            center = (img.cell[ 0, : ] + img.cell[ 1, : ] ) /2.
-            center[ 2 ] = 0.
-            img.positions[ :, 0 ] -= ref[ 0 ]
-            img.positions[ :, 1 ] -= ref[ 1 ]
-            img.positions[ :, 0 ] += center[ 0 ]
-            img.positions[ :, 1 ] += center[ 1 ]
-            img.wrap()
-            prefix = str( count )
-            fout = 'frame_' + prefix
-            if not os.path.isfile( fout + '.png' ):
-                get_figure_2( img, fout, rot = "180z,-80x", w = 13, h = 12 )
-            os.system( 'rm -f *.ini *.pov' )
-            '''
-            img[79].symbol = 'S'
-            img[80].symbol = 'S'
-            ref = img[ 98 ].position * 1.
-            center = (img.cell[ 0, : ] + img.cell[ 1, : ] ) /2.
-            center[ 2 ] = 0.
-            img.positions[ :, 0 ] -= ref[ 0 ]
-            img.positions[ :, 1 ] -= ref[ 1 ]
-            img.positions[ :, 0 ] += center[ 0 ]
-            img.positions[ :, 1 ] += center[ 1 ]
-            #img.wrap()
-            prefix = str( count )
-            fout = 'frame_' + prefix
-            if not os.path.isfile( fout + '.png' ):
-                get_figure_2( img, fout, rot = "0z,-90x", w = 20, h = 20 )
-            os.system( 'rm -f *.ini *.pov' )
-            '''
+    movie = "--movie" in sys.argv
+    jobs = get_jobs( loc, dirs, step, start, resume = not movie )
+    print( "%d frames to render with %d workers" % ( len( jobs ), workers ) )
+    with ProcessPoolExecutor( max_workers = workers, initializer = init_worker, initargs = ( loc, idx1, idx2, backend ) ) as executor:
+        if movie:
+            #render_arrays keeps the order of the frames and at most 2 frames per worker in memory
+            print( write_video( render_arrays( executor, jobs, 2 * workers ), loc + 'MD_preview.mp4', fps = 10 ), "frames written to MD_preview.mp4" )
+        else:
+            #consecutive frames go to the same worker, so its SceneTemplate can reuse the neighbor list
+            chunksize = max( 1, len( jobs ) // ( 4 * workers ) )
+            for count in executor.map( render_frame, jobs, chunksize = chunksize ):
+                print( count )
@@ -1,15 +1,17 @@
 import os
+import glob
+from video import write_video, read_rgb8
 
-image_folder='./outdir/'
-#image_files = sorted( [img for img in os.listdir(image_folder) if img.endswith(".png")] )
-image_files = []
-for i in range( 30000 ):
-    if os.path.isfile( image_folder + 'tframe_' + str(i) +'.png' ):
-        image_files.append( 'tframe_' + str(i) +'.png' )
-image_list  = [ os.path.join(image_folder,img) for img in image_files]
-print ( image_list)
+# Builds the movie from the frame_N.png files of generate_image.py in one pass: every PNG is read once, gets its time label
+# ( as add_time.py ) and is piped into ffmpeg, so no time-stamped copies are written.
+image_folder='./'
+
+def get_step( image_name ):
+    return int( os.path.basename( image_name ).replace( 'frame_','' ).replace( '.png','' ) )
+
+image_list = sorted( glob.glob( os.path.join( image_folder, 'frame_*.png' ) ), key = get_step )
+print ( len( image_list ), "frames" )
 
 fps = 10
 output = "MD_"
-clip = moviepy.video.io.ImageSequenceClip.ImageSequenceClip(image_list, fps=fps)
-clip.write_videofile(output + '.mp4')
+write_video( ( ( read_rgb8( x ), get_step( x ) ) for x in image_list ), output + '.mp4', fps = fps )
@@ -1,15 +1,112 @@
-from dlePy.vasp.outcar2traj import *
 import os
-images = []
-data = {}
-paths =  [x for x in os.listdir( '.' ) if 'RUN' in x ]
-for path in paths:
-    if not os.path.isfile( path + '/MOVIE.traj' ):
-        images = []
-        data = {}
-        outcar = path + '/OUTCAR.gz'
-        images, data = read_OUTCAR( outcar , maxiter = 20000, images = images, data = data  )
-        traj = Trajectory( path + '/MOVIE.traj', 'w')
-        add_to_traj( traj=traj, images=images, first = 0, last = 20000)
-        with open( path + '/DATA.js', 'w' ) as f:
+import json as js
+from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor
+from ase.io import read
+from ase.io.trajectory import Trajectory
+from outcar_reader import iread_outcar_atoms
+
+# Checks if MOVIE.traj and DATA.js of a RUN directory are newer than its OUTCAR.gz ( or OUTCAR ).
+# path: The path to the RUN directory.
+# Returns: True if both outputs exist and are up to date, otherwise False.
+def is_up_to_date( path ):
+    outcar = get_outcar( path )
+    outputs = [ os.path.join( path, 'MOVIE.traj' ), os.path.join( path, 'DATA.js' ) ]
+    if not all( os.path.isfile( x ) for x in outputs ):
+        return False
+    if outcar is None:
+        return True
+    return min( os.path.getmtime( x ) for x in outputs ) >= os.path.getmtime( outcar )
+
+# Returns the OUTCAR.gz ( preferred ) or OUTCAR of a RUN directory, or None if there is none.
+def get_outcar( path ):
+    for name in [ 'OUTCAR.gz', 'OUTCAR' ]:
+        if os.path.isfile( os.path.join( path, name ) ):
+            return os.path.join( path, name )
+    return None
+
+# Returns the chemical symbols to use for the frames, or None to keep the ones of the OUTCAR.
+# ionspertype: The "ions per type" line of the CONTCAR ( e.g. "4 40 1 80" ). If given, the symbols are taken from the CONTCAR/POSCAR
+#              next to the OUTCAR, which must have the same number of ions per type.
+def get_symbols( path, ionspertype = '' ):
+    if not ionspertype.strip():
+        return None
+    for name in [ 'CONTCAR', 'POSCAR' ]:
+        if os.path.isfile( os.path.join( path, name ) ):
+            system = read( os.path.join( path, name ), format = 'vasp' )
+            break
+    else:
+        return None
+    counts = [ int( x ) for x in ionspertype.split() ]
+    symbols = system.get_chemical_symbols()
+    system_counts = [ len( list( group ) ) for _, group in groupby( symbols ) ]
+    if counts != system_counts:
+        raise ValueError( "ions per type %s does not match %s of %s" % ( ionspertype, " ".join( str( x ) for x in system_counts ), path ) )
+    return symbols
+
+# Converts the OUTCAR of one RUN directory into MOVIE.traj and DATA.js.
+# - Frames are streamed: every frame is written to the trajectory as soon as it is parsed, so at most one frame is held in memory.
+# - OUTCAR.gz is decompressed on the fly and corrupt ( binary ) lines are skipped by outcar_reader, so neither gunzip nor fix.py is needed.
+# - Both files are written under temporary names and renamed at the end, so an interrupted conversion is redone next time.
+#   The temporary files are removed if the conversion fails.
+# path: The path to the RUN directory.
+# maxiter: The maximum number of frames. Default is 20000.
+# ionspertype: See get_symbols. Default is ''.
+# force: If True, the RUN is converted even if its outputs are up to date. Default is False.
+# Returns: The number of frames written, or None if the RUN was skipped.
+def convert_run( path, maxiter = 20000, ionspertype = '', force = False ):
+    outcar = get_outcar( path )
+    if outcar is None or ( not force and is_up_to_date( path ) ):
+        return None
+    symbols = get_symbols( path, ionspertype )
+    data = {}
+    skipped = []
+    traj = Trajectory( os.path.join( path, 'MOVIE.traj.tmp' ), 'w' )
+    try:
+        for i, atoms in enumerate( iread_outcar_atoms( outcar, maxiter, skipped ) ):
+            if symbols is not None:
+                if len( symbols ) != len( atoms ):
+                    raise ValueError( "%s has %d atoms, the CONTCAR of %s has %d" % ( outcar, len( atoms ), path, len( symbols ) ) )
+                atoms.set_chemical_symbols( symbols )
+            traj.write( atoms )
+            data[ str( i ) ] = { 'energy': atoms.get_potential_energy() }
+        traj.close()
+        if skipped:
+            print( "%s: skipped %d corrupt lines of %s" % ( path, len( skipped ), outcar ) )
+        with open( os.path.join( path, 'DATA.js.tmp' ), 'w' ) as f:
             js.dump( data, f )
+    except BaseException:
+        traj.close()
+        for name in [ 'MOVIE.traj.tmp', 'DATA.js.tmp' ]:
+            if os.path.isfile( os.path.join( path, name ) ):
+                os.remove( os.path.join( path, name ) )
+        raise
+    os.replace( os.path.join( path, 'MOVIE.traj.tmp' ), os.path.join( path, 'MOVIE.traj' ) )
+    os.replace( os.path.join( path, 'DATA.js.tmp' ), os.path.join( path, 'DATA.js' ) )
+    return len( data )
+
+# Converts several RUN directories in a process pool, skipping those without an OUTCAR and those that are up to date.
+# paths: A list of RUN directories.
+# workers: The number of worker processes. Default is None, which uses all available cores.
+# maxiter, ionspertype, force: See convert_run.
+# Returns: A dictionary mapping every path to the number of frames written ( None if skipped or failed ).
+#          A RUN that fails is reported and left out, the other RUNs are still converted.
+def convert_runs( paths, workers = None, maxiter = 20000, ionspertype = '', force = False ):
+    paths = [ x for x in paths if get_outcar( x ) is not None and ( force or not is_up_to_date( x ) ) ]
+    if not paths:
+        return {}
+    results = {}
+    with ProcessPoolExecutor( max_workers = workers ) as executor:
+        futures = { path: executor.submit( convert_run, path, maxiter, ionspertype, force ) for path in paths }
+        for path, future in futures.items():
+            try:
+                results[ path ] = future.result()
+            except Exception as error:
+                print( "%s: conversion failed: %s" % ( path, error ) )
+                results[ path ] = None
+    return results
+
+if __name__ == "__main__":
+    paths = [ x for x in os.listdir( '.' ) if 'RUN' in x and os.path.isdir( x ) ]
+    for path, frames in convert_runs( paths ).items():
+        print( path, frames )
@@ -6,7 +6,6 @@ do
 	cd $i
 	if ls frame*.png 1> /dev/null 2>&1; then
     	echo "Files found! Performing action..."
-		python add_time.py
 		python movie.py
 	else
     	echo "No matching files found."
@@ -0,0 +1,129 @@
+import shutil
+import subprocess
+import numpy as np
+from PIL import Image
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Streams frames ( RGBA arrays ) into an mp4 without writing intermediate PNGs.
+# Every frame gets the "t = x ps" label of add_time.py burnt in and is piped as raw RGB into ffmpeg.
+
+# Returns the label of add_time.py for MD step t ( 1 fs per step ), e.g. 't = 0.025 ps'.
+def get_time_text( t ):
+    time_text = str( round( t/1000, 3 ) )
+    if len( time_text ) == 3:
+        time_text += '00'
+    elif len( time_text ) == 4:
+        time_text += '0'
+    return 't = ' + time_text + ' ps'
+
+# Returns the ffmpeg executable: the one on the PATH, otherwise the one shipped with moviepy ( imageio-ffmpeg ).
+def get_ffmpeg( ):
+    ffmpeg = shutil.which( 'ffmpeg' )
+    if ffmpeg is not None:
+        return ffmpeg
+    try:
+        import imageio_ffmpeg
+    except ImportError:
+        raise RuntimeError( "ffmpeg was not found; install ffmpeg or moviepy" )
+    return imageio_ffmpeg.get_ffmpeg_exe( )
+
+# Converts an image ( float in [ 0, 1 ] or uint8, RGB or RGBA ) to uint8 RGB over a white background,
+# padded with white to even width and height as required by yuv420p.
+def to_rgb8( image ):
+    image = np.asarray( image )
+    if image.dtype == np.uint8 and image.shape[ 2 ] == 4:
+        image = image.astype( np.float32 ) / 255.
+    if image.shape[ 2 ] == 4:
+        alpha = image[ :, :, 3:4 ]
+        image = image[ :, :, :3 ] * alpha + ( 1. - alpha )
+    if image.dtype != np.uint8:
+        image = ( np.clip( image, 0., 1. ) * 255. + 0.5 ).astype( np.uint8 )
+    ny, nx = image.shape[ :2 ]
+    if ny % 2 or nx % 2:
+        image = np.pad( image, ( ( 0, ny % 2 ), ( 0, nx % 2 ), ( 0, 0 ) ), constant_values = 255 )
+    return image
+
+# Reads an image file ( e.g. frame_N.png ) as uint8 RGB over a white background; the blending is done by Pillow, without float copies.
+def read_rgb8( image_name ):
+    image = Image.open( image_name ).convert( 'RGBA' )
+    background = Image.new( 'RGBA', image.size, ( 255, 255, 255, 255 ) )
+    return np.array( Image.alpha_composite( background, image ).convert( 'RGB' ) )
+
+# The time label of add_time.py ( bold, 12 pt on a 4 inch wide frame, on a translucent white box in the top left corner ),
+# drawn once per frame on a small reused canvas and blended into the top rows of the frame.
+class TimeStamp:
+    def __init__( self, width, lx = 4, fontsize = 12 ):
+        self.fig = Figure( figsize = ( lx, lx/8. ), dpi = width / lx )
+        self.canvas = FigureCanvasAgg( self.fig )
+        self.fig.patch.set_alpha( 0. )
+        ny = int( round( lx/8. * width / lx ) )
+        self.text = self.fig.text( 1. / width, 1. - 1. / ny, '', color = 'k', fontsize = fontsize, fontweight = 'bold', va = 'top', ha = 'left', bbox=dict(facecolor='white', edgecolor='none', alpha = 0.3, pad=1.0) )
+
+    # Draws text on frame ( uint8 RGB, modified in place ) and returns it.
+    def __call__( self, frame, text ):
+        self.text.set_text( text )
+        self.canvas.draw( )
+        label = np.asarray( self.canvas.buffer_rgba( ) )
+        ny = min( label.shape[ 0 ], frame.shape[ 0 ] )
+        nx = min( label.shape[ 1 ], frame.shape[ 1 ] )
+        alpha = label[ :ny, :nx, 3:4 ].astype( np.uint16 )
+        top = frame[ :ny, :nx ]
+        top[ : ] = ( ( label[ :ny, :nx, :3 ] * alpha + top * ( 255 - alpha ) + 127 ) // 255 ).astype( np.uint8 )
+        return frame
+
+# Pipes frames into ffmpeg ( H.264, yuv420p ). The size is taken from the first frame; all frames must have the same size.
+# Usage: with VideoWriter( 'MD_.mp4', fps = 10 ) as writer: writer.write( image, t )
+class VideoWriter:
+    def __init__( self, output, fps = 10, timestamps = True ):
+        self.output = output
+        self.fps = fps
+        self.timestamps = timestamps
+        self.process = None
+        self.stamp = None
+        self.count = 0
+
+    def open( self, nx, ny ):
+        command = [ get_ffmpeg( ), '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', '%dx%d' % ( nx, ny ), '-r', str( self.fps ), '-i', '-',
+                    '-an', '-vcodec', 'libx264', '-pix_fmt', 'yuv420p', self.output ]
+        self.process = subprocess.Popen( command, stdin = subprocess.PIPE )
+        self.shape = ( ny, nx, 3 )
+        if self.timestamps:
+            self.stamp = TimeStamp( nx )
+
+    # Writes one frame. image: RGB(A) array, see to_rgb8; t: The MD step of the frame for the time label ( None for no label ).
+    def write( self, image, t = None ):
+        frame = to_rgb8( image )
+        if self.process is None:
+            self.open( frame.shape[ 1 ], frame.shape[ 0 ] )
+        if frame.shape != self.shape:
+            raise ValueError( "frame size %s differs from the first frame %s" % ( frame.shape, self.shape ) )
+        if self.stamp is not None and t is not None:
+            frame = self.stamp( frame, get_time_text( t ) )
+        self.process.stdin.write( np.ascontiguousarray( frame ).tobytes( ) )
+        self.count += 1
+
+    def close( self ):
+        if self.process is None:
+            return
+        self.process.stdin.close( )
+        if self.process.wait( ) != 0:
+            raise RuntimeError( "ffmpeg failed writing %s" % self.output )
+        self.process = None
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *args ):
+        self.close( )
+
+# Writes frames into output.
+# frames: An iterable of ( image, t ) pairs, e.g. arrays rendered with figure.get_figure_2( ..., backend = 'raster' ) or read from frame_N.png.
+# fps: Frames per second. Default is 10.
+# timestamps: If True, the time label is burnt into every frame. Default is True.
+# Returns: The number of frames written.
+def write_video( frames, output, fps = 10, timestamps = True ):
+    with VideoWriter( output, fps = fps, timestamps = timestamps ) as writer:
+        for image, t in frames:
+            writer.write( image, t )
+    return writer.count
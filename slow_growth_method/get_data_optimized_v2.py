@@ -5,12 +5,22 @@ import gzip
 import glob
 import json
 import shutil
+import fnmatch
+import hashlib
 import getpass
+import tempfile
+import dataclasses
 import get_mols
 import numpy as np
 import pandas as pd
+from typing import Optional, Union
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from ase.io import read
-from ase.io.trajectory import Trajectory
+from scipy.integrate import cumulative_simpson
+from scipy.interpolate import CubicSpline
+from simulation_database import SimulationDatabase, open_database, to_json, METRIC_COLUMNS
+from simulation_context import SimulationContext, get_simulation_context, get_ICONST_path
+from trajectory_store import get_trajectory_stores
 
 # Retrieves and returns a sorted list of directories in the current working directory.
 # - Only directories that start with "RUN" are considered.
@@ -85,31 +95,120 @@ def get_max_frame_number():
 	return max_n if max_n != -1 else None
 
 # Retrieves atomic positions from molecular dynamics (MD) simulation trajectory.
+# The positions are read from the TrajectoryStore of every RUN directory (built from MOVIE.traj on first use).
 # path_to_MD_simulation: Path to the directory containing the MD simulation data.
 # atom1: Index or identifier for the first atom of interest.
 # atom2: Index or identifier for the second atom of interest.
-# Returns: Two lists containing the positions of atom1 and atom2 over time.
+# Returns: Two float64 NumPy arrays of shape ( n_frames, 3 ) containing the positions of atom1 and atom2 over time.
 def get_MD_atom_positions( path_to_MD_simulation, atom1, atom2 ):
-	step  = 1
-	count = -1
-	start = -1
-	dirs = get_dirs()
-	system = read( path_to_MD_simulation + '/RUN1/POSCAR' )
-	pos1 = list()
-	pos2 = list()
-	for dir in dirs:
-		with open( dir + '/DATA.js', 'r' ) as f:
-			data = json.load( f )
-		npoints = len( data.keys() )
-		traj = Trajectory( dir + '/MOVIE.traj', 'r' )
-		for i in range( 0, len( traj ) ):
-			count += 1
-			if count > start and count % step == 0:
-				struc = traj[ i ]
-				pos1.append(  list( struc[ atom1 ].position )  )
-				pos2.append(  list( struc[ atom2 ].position )  )
+	stores = get_trajectory_stores( path_to_MD_simulation )
+	if not stores:
+		return np.empty( ( 0, 3 ) ), np.empty( ( 0, 3 ) )
+	pos1 = np.concatenate( [ store.get_atom_positions( atom1 ) for store in stores ] ).astype( np.float64 )
+	pos2 = np.concatenate( [ store.get_atom_positions( atom2 ) for store in stores ] ).astype( np.float64 )
 	return pos1, pos2
 
+# Lattice shifts of the 27 periodic images around the home cell.
+IMAGE_SHIFTS = np.array( [ [ i, j, k ] for i in ( -1, 0, 1 ) for j in ( -1, 0, 1 ) for k in ( -1, 0, 1 ) ], dtype = float )
+
+# Applies the minimum image convention to displacement vectors of several frames, each with its own cell.
+# - The vectors are wrapped to fractional coordinates in [ -0.5, 0.5 ), which is exact for orthogonal cells.
+# - For non-orthogonal cells the shortest of the 27 neighboring images is taken, as in ase.geometry.find_mic.
+# vectors: Array of shape ( n_frames, ..., 3 ).
+# cells: Array of shape ( n_frames, 3, 3 ), or None to leave the vectors unchanged.
+# Returns: The minimum-image vectors, same shape as vectors.
+def get_mic_vectors( vectors, cells ):
+	if cells is None:
+		return vectors
+	fractional = np.einsum( "f...k,fkl->f...l", vectors, np.linalg.inv( cells ) )
+	fractional -= np.round( fractional )
+	vectors = np.einsum( "f...k,fkl->f...l", fractional, cells )
+	if np.allclose( cells - cells * np.eye( 3 ), 0. ):
+		return vectors
+	images = np.einsum( "sk,fkl->fsl", IMAGE_SHIFTS, cells ).reshape( ( len( cells ), ) + ( 1, ) * ( vectors.ndim - 2 ) + ( len( IMAGE_SHIFTS ), 3 ) )
+	candidates = vectors[ ..., None, : ] + images
+	shortest = np.argmin( np.sum( candidates ** 2, axis = -1 ), axis = -1 )
+	return np.take_along_axis( candidates, shortest[ ..., None, None ], axis = -2 )[ ..., 0, : ]
+
+# Computes atom-pair distances for all frames at once.
+# positions: Array of shape ( n_frames, n_atoms, 3 ).
+# pairs: Array-like of shape ( n_pairs, 2 ) with atom indices.
+# cells: Array of shape ( n_frames, 3, 3 ) for minimum-image distances, or None. Default is None.
+# Returns: A float64 array of shape ( n_frames, n_pairs ).
+def get_pair_distances( positions, pairs, cells = None ):
+	pairs = np.asarray( pairs, dtype = int ).reshape( -1, 2 )
+	vectors = get_mic_vectors( positions[ :, pairs[ :, 1 ] ] - positions[ :, pairs[ :, 0 ] ], cells )
+	return np.linalg.norm( vectors, axis = -1 )
+
+# Computes the angles i-j-k ( j is the vertex ) for all frames at once.
+# positions: Array of shape ( n_frames, n_atoms, 3 ).
+# triplets: Array-like of shape ( n_triplets, 3 ) with atom indices.
+# cells: Array of shape ( n_frames, 3, 3 ) for minimum-image vectors, or None. Default is None.
+# Returns: A float64 array of shape ( n_frames, n_triplets ) with the angles in degrees.
+def get_angles( positions, triplets, cells = None ):
+	triplets = np.asarray( triplets, dtype = int ).reshape( -1, 3 )
+	v1 = get_mic_vectors( positions[ :, triplets[ :, 0 ] ] - positions[ :, triplets[ :, 1 ] ], cells )
+	v2 = get_mic_vectors( positions[ :, triplets[ :, 2 ] ] - positions[ :, triplets[ :, 1 ] ], cells )
+	cosine = np.sum( v1 * v2, axis = -1 ) / ( np.linalg.norm( v1, axis = -1 ) * np.linalg.norm( v2, axis = -1 ) )
+	return np.degrees( np.arccos( np.clip( cosine, -1., 1. ) ) )
+
+# Counts, for every center atom and frame, the neighbor atoms within a cutoff ( the center itself is never counted ).
+# positions: Array of shape ( n_frames, n_atoms, 3 ).
+# centers: Array-like with the indices of the center atoms.
+# neighbors: Array-like with the indices of the candidate neighbor atoms, e.g. all H atoms.
+# cutoff: The cutoff distance in Angstrom.
+# cells: Array of shape ( n_frames, 3, 3 ) for minimum-image distances, or None. Default is None.
+# chunk_size: The number of frames processed at once, to bound the memory of the ( frames, centers, neighbors ) distance block. Default is 512.
+# Returns: An int array of shape ( n_frames, n_centers ).
+def get_coordination( positions, centers, neighbors, cutoff, cells = None, chunk_size = 512 ):
+	centers = np.asarray( centers, dtype = int ).ravel()
+	neighbors = np.asarray( neighbors, dtype = int ).ravel()
+	same = centers[ :, None ] == neighbors[ None, : ]
+	coordination = np.empty( ( len( positions ), len( centers ) ), dtype = int )
+	for i in range( 0, len( positions ), chunk_size ):
+		block = positions[ i:i + chunk_size ]
+		vectors = block[ :, None, neighbors ] - block[ :, centers, None ]
+		if cells is not None:
+			vectors = get_mic_vectors( vectors, cells[ i:i + chunk_size ] )
+		within = np.linalg.norm( vectors, axis = -1 ) < cutoff
+		coordination[ i:i + chunk_size ] = np.sum( within & ~same, axis = -1 )
+	return coordination
+
+# Extracts distance, angle and coordination time series of an MD simulation in one pass over its RUN directories.
+# - Every RUN is read from its TrajectoryStore, and only the requested frames and atoms are loaded from the memory map.
+# - Frames are numbered continuously over the RUNs; a frame g is used if g >= start and g % step == 0.
+# path_to_MD_simulation: Path to the directory containing the RUN directories.
+# pairs: Atom index pairs ( n_pairs, 2 ) for distances. Default is none.
+# triplets: Atom index triplets ( n_triplets, 3 ) for angles, the middle atom being the vertex. Default is none.
+# centers, neighbors, cutoff: Center atoms, candidate neighbor atoms and cutoff for coordination numbers (see get_coordination). Default is none.
+# start: The first frame. Default is 0.
+# step: Use every step-th frame. Default is 1.
+# mic: If True, the minimum image convention is applied with the cell of every frame. Default is True.
+# Returns: A dictionary with NumPy arrays: "frames" ( n_frames ), "distances" ( n_frames, n_pairs ), "angles" ( n_frames, n_triplets ) and "coordination" ( n_frames, n_centers ).
+def get_MD_time_series( path_to_MD_simulation, pairs = (), triplets = (), centers = (), neighbors = (), cutoff = 1.2, start = 0, step = 1, mic = True ):
+	pairs = np.asarray( pairs, dtype = int ).reshape( -1, 2 )
+	triplets = np.asarray( triplets, dtype = int ).reshape( -1, 3 )
+	centers = np.asarray( centers, dtype = int ).ravel()
+	neighbors = np.asarray( neighbors, dtype = int ).ravel()
+	atoms = np.unique( np.concatenate( [ pairs.ravel(), triplets.ravel(), centers, neighbors ] ) )
+
+	series = { "frames": [], "distances": [], "angles": [], "coordination": [] }
+	offset = 0
+	for store in get_trajectory_stores( path_to_MD_simulation ):
+		first = max( start - offset, 0 )
+		first += ( -( offset + first ) ) % step
+		positions = np.asarray( store.positions[ first::step, atoms ], dtype = np.float64 )
+		cells = store.cells[ first::step ] if mic and store.pbc.any() else None
+		series[ "frames" ].append( np.arange( offset + first, offset + len( store ), step ) )
+		series[ "distances" ].append( get_pair_distances( positions, np.searchsorted( atoms, pairs ), cells ) )
+		series[ "angles" ].append( get_angles( positions, np.searchsorted( atoms, triplets ), cells ) )
+		series[ "coordination" ].append( get_coordination( positions, np.searchsorted( atoms, centers ), np.searchsorted( atoms, neighbors ), cutoff, cells ) )
+		offset += len( store )
+
+	if not series[ "frames" ]:
+		return { "frames": np.empty( 0, dtype = int ), "distances": np.empty( ( 0, len( pairs ) ) ), "angles": np.empty( ( 0, len( triplets ) ) ), "coordination": np.empty( ( 0, len( centers ) ), dtype = int ) }
+	return { key: np.concatenate( value ) for key, value in series.items() }
+
 # Renames specific frame files in the current directory based on given rules.
 # - "frame_0.png" is copied and renamed to "IS_<aux_name>.png".
 # - "frame_FS.png" (where FS is a given integer) is copied and renamed to "FS_<aux_name>.png".
@@ -161,16 +260,18 @@ def get_H_from_ICONST( iconst, verbose = False ):
 ################################# FROM ICONST #################################
 
 # Parses an ICONST file to extract atomic indices based on the number of lines in the file.
-# iconst: Path to the ICONST file.
+# path_to_SG_simulation: Path to the SG simulation or a SimulationContext (whose already read ICONST lines are reused).
 # verbose: If True, prints detailed index information. Defaults to False.
 # Returns:
 # - If the ICONST file has 2 lines, returns a tuple (H_idx, O_idx) with zero-based indices.
 # - If the ICONST file has 3 lines, returns a tuple (O_H2O_idx, H_H2O_idx, H_cation_idx) with zero-based indices.
 # Raises: ValueError if the ICONST file contains less than 2 lines or more than 3 lines.
 def get_data_ICONST( path_to_SG_simulation, verbose = False ):
-	iconst_path = os.path.join( path_to_SG_simulation, "RUN1/ICONST" )
-	with open( iconst_path ) as file:
-		lines = [ line.rstrip() for line in file ]
+	if isinstance( path_to_SG_simulation, SimulationContext ):
+		lines = path_to_SG_simulation.iconst_lines
+	else:
+		with open( get_ICONST_path( path_to_SG_simulation ) ) as file:
+			lines = [ line.rstrip() for line in file ]
 
 	if len( lines ) < 2:
 		raise ValueError( "ICONST file must contain at least two lines." )
@@ -203,11 +304,13 @@ def get_data_ICONST( path_to_SG_simulation, verbose = False ):
 	return int( O_idx ), int( H_idx ), int( H_cation_idx )
 
 # Standardizes the ICONST data by ensuring it follows a consistent format.
-# iconst_data: A list containing either 2 or 3 indices representing atomic relationships.
+# path_to_SG_simulation: Path to the SG simulation or a SimulationContext.
 # Returns: A tuple containing (H_idx, O_idx, H_cation_idx). If only two indices are provided, H_cation_idx is set to NaN.
 # Raises: ValueError if the input does not contain exactly 2 or 3 elements.
 def get_standarized_ICONST_data( path_to_SG_simulation ):
 	iconst_data = get_data_ICONST( path_to_SG_simulation )
+	if isinstance( path_to_SG_simulation, SimulationContext ):
+		path_to_SG_simulation = path_to_SG_simulation.path
 	cations = [ "NH4", "CH3NH3" ]
 	if len( iconst_data ) == 2 and any( cation + "_splitting" not in path_to_SG_simulation for cation in cations ):
 		H_idx, O_idx = iconst_data
@@ -222,13 +325,14 @@ def get_standarized_ICONST_data( path_to_SG_simulation ):
 		raise ValueError( "ICONST file must have 2 or 3 lines" )
 
 # Computes the initial distance between Oxygen and a cation-associated Hydrogen, if present.
-# path_to_SG_simulation: Path to the simulation data directory.
+# path_to_SG_simulation: Path to the simulation data directory or a SimulationContext.
 # verbose: Boolean flag for printing the distance (default: False).
 # Returns: The Euclidean distance between Oxygen (O_idx) and cation-associated Hydrogen (H_cation_idx), rounded to 2 decimal places.
 # If no valid H_cation_idx is found, returns NaN.
 def get_initial_H_N_distance( path_to_SG_simulation, verbose = False ):
-	system = get_initial_system( path_to_SG_simulation )
-	H_idx, O_idx, H_cation_idx = get_standarized_ICONST_data( path_to_SG_simulation )
+	context = get_simulation_context( path_to_SG_simulation )
+	system = context.system
+	H_idx, O_idx, H_cation_idx = get_standarized_ICONST_data( context )
 	if not np.isnan( H_cation_idx ):
 		distance = round( np.linalg.norm( system.positions[ O_idx ] - system.positions[ H_cation_idx ] ), 2 )
 	else:
@@ -238,26 +342,16 @@ def get_initial_H_N_distance( path_to_SG_simulation, verbose = False ):
 	return distance
 
 # Calculates the minimum initial distance between the "H" atom and any "Au" atom in the system.
-# path_to_SG_calculation: The path to the SG calculation directory.
+# path_to_SG_calculation: The path to the SG calculation directory or a SimulationContext.
 # verbose: A flag (string) to control whether the minimum distance is printed ("True" for printing, default is "False").
 # Returns: The minimum distance between the "H" atom and any "Au" atom, rounded to 2 decimal places.
 def get_initial_H_Au_distance( path_to_SG_simulation, verbose = False ):
-	distance_H_to_Au = list()
-	os.chdir( path_to_SG_simulation )
-	runs = get_RUNs( path_to_SG_simulation )
-	H_idx, O_idx, H_cation_idx = get_standarized_ICONST_data( path_to_SG_simulation )
+	context = get_simulation_context( path_to_SG_simulation )
+	H_idx, O_idx, H_cation_idx = get_standarized_ICONST_data( context )
+	distance_H_to_Au, closest_Au = get_mols.get_nearest_surface_atom( context.system, H_idx, surface_indices = context.get_indices( "Au" ) )
 
-	if not runs:
-		system = read( "POSCAR" )
-	else:
-		system = read( "RUN1/POSCAR" )
-	au_indices = get_element_indices( system, "Au" )
-
-	for au_idx in au_indices:
-		distance_H_to_Au.append( ( np.linalg.norm( system.positions[ au_idx ] - system.positions[ H_idx ] ), au_idx ) )
-
-	min_H_Au_dist, Au_idx = min( distance_H_to_Au, key=lambda x: x[ 0 ] )
-	min_H_Au_dist = round( min_H_Au_dist, 2 )
+	min_H_Au_dist = round( distance_H_to_Au[ 0 ], 2 )
+	Au_idx = int( closest_Au[ 0 ] )
 
 	if verbose:
 		print("min_H_Au_dist:", min_H_Au_dist, "| Closest Au_idx:", Au_idx )
@@ -265,11 +359,12 @@ def get_initial_H_Au_distance( path_to_SG_simulation, verbose = False ):
 	return min_H_Au_dist,  str( H_idx ) + "-" + str( Au_idx )
 
 # Retrieves the initial system configuration from a SG simulation.
-# path_to_SG_simulation: The path to the SG simulation directory.
+# path_to_SG_simulation: The path to the SG simulation directory or a SimulationContext.
 # Returns: The initial atomic structure read from the POSCAR file, either from the first run in the directory or directly from the main path if no runs are found.
 def get_initial_system( path_to_SG_simulation ):
+	if isinstance( path_to_SG_simulation, SimulationContext ):
+		return path_to_SG_simulation.system
 	runs = get_RUNs( path_to_SG_simulation )
-	path = convert( path_to_SG_simulation )
 	if not runs:
 		return read( os.path.join( path_to_SG_simulation, "POSCAR" ) )
 	else:
@@ -284,14 +379,15 @@ def get_min_distance( reference_position, positions ):
 	return round( min( distances ), 2 )
 
 # Gets the minimum distances between oxygen and cation/hydrogen.
-# path_to_SG_simulation: Path to SG simulation.
+# path_to_SG_simulation: Path to SG simulation or a SimulationContext.
 # cation_type: "Na", "N-NH4", or "N-CH3NH3".
 # verbose: Prints debug info if True.
 # Returns: (O?cation distance, O?H distance, H-bond info).
 def get_distances( path_to_SG_simulation, cation_type, verbose = False ):
-	system = get_initial_system( path_to_SG_simulation )
+	context = get_simulation_context( path_to_SG_simulation )
+	system = context.system
 
-	iconst_data = get_data_ICONST( path_to_SG_simulation, verbose )
+	iconst_data = get_data_ICONST( context, verbose )
 	if len( iconst_data ) == 2:
 		H_idx, O_idx = iconst_data
 		H_cation_idx = np.nan
@@ -302,22 +398,12 @@ def get_distances( path_to_SG_simulation, cation_type, verbose = False ):
 	closest_H_distance = float( "inf" )
 	closest_H_idx = None
 
-	runs = get_RUNs( path_to_SG_simulation )
 	if cation_type == "Na":
-		if not runs:
-			cation_list = get_mols.get_Na_mols( path_to_SG_simulation )
-		else:
-			cation_list = get_mols.get_Na_mols( path_to_SG_simulation + "/RUN1" )
+		cation_list = get_mols.get_Na_mols( context )
 	elif cation_type == "N-NH4":
-		if not runs:
-			cation_list = get_mols.get_NH4_mols( path_to_SG_simulation )
-		else:
-			cation_list = get_mols.get_NH4_mols( path_to_SG_simulation + "/RUN1" )
+		cation_list = get_mols.get_NH4_mols( context )
 	elif cation_type == "N-CH3NH3":
-		if not runs:
-			cation_list = get_mols.get_CH3NH3_mols( path_to_SG_simulation )
-		else:
-			cation_list = get_mols.get_CH3NH3_mols( path_to_SG_simulation + "/RUN1" )
+		cation_list = get_mols.get_CH3NH3_mols( context )
 	else:
 		raise ValueError( "Unsupported cation type. Supported types are: 'Na', 'N-NH4', 'N-CH3NH3'." )
 
@@ -355,93 +441,234 @@ def get_distances( path_to_SG_simulation, cation_type, verbose = False ):
 
 ################################# SLOW GROWTH METHOD #################################
 
+# Regular expressions applied to whole chunks of a REPORT file.
+# - REPORT_CC_PATTERN captures the 4th column (index 3) of every line containing "cc".
+# - REPORT_BM_PATTERN captures the 2nd column (index 1) of every line containing "b_m".
+REPORT_CC_PATTERN = re.compile( rb"^(?=[^\n]*cc)[ \t]*\S+[ \t]+\S+[ \t]+\S+[ \t]+(\S+)", re.MULTILINE )
+REPORT_BM_PATTERN = re.compile( rb"^(?=[^\n]*b_m)[ \t]*\S+[ \t]+(\S+)", re.MULTILINE )
+
+# Appends the values of a chunk to a preallocated float64 buffer, growing it geometrically when full.
+# buffer: The preallocated NumPy array.
+# size: The number of values already stored in the buffer.
+# values: A list of byte strings holding the numbers to append.
+# Returns: The (possibly reallocated) buffer and the new number of stored values.
+def append_to_buffer( buffer, size, values ):
+	if not values:
+		return buffer, size
+	new_size = size + len( values )
+	if new_size > len( buffer ):
+		grown = np.empty( max( new_size, 2 * len( buffer ) ), dtype = np.float64 )
+		grown[ :size ] = buffer[ :size ]
+		buffer = grown
+	buffer[ size:new_size ] = np.array( values ).astype( np.float64 )
+	return buffer, new_size
+
+# Streams a REPORT or REPORT.gz file in a single pass and extracts the "cc" and "b_m" columns.
+# - The file is read in fixed-size binary chunks; only the unfinished last line of a chunk is carried over.
+# - The columns are written straight into preallocated float64 arrays.
+# path_to_report: The path to the REPORT or REPORT.gz file.
+# chunk_size: The number of bytes read at a time. Default is 4 MB.
+# Returns: Two NumPy arrays - column 3 of the lines with "cc" and column 1 of the lines with "b_m".
+def read_report( path_to_report, chunk_size = 1 << 22 ):
+	opener = gzip.open if path_to_report.endswith( ".gz" ) else open
+	cc = np.empty( 1 << 14, dtype = np.float64 )
+	b_m = np.empty( 1 << 14, dtype = np.float64 )
+	n_cc = 0
+	n_bm = 0
+	tail = b""
+	with opener( path_to_report, "rb" ) as file:
+		while True:
+			chunk = file.read( chunk_size )
+			if not chunk:
+				break
+			chunk = tail + chunk
+			end = chunk.rfind( b"\n" ) + 1
+			tail = chunk[ end: ]
+			cc, n_cc = append_to_buffer( cc, n_cc, REPORT_CC_PATTERN.findall( chunk, 0, end ) )
+			b_m, n_bm = append_to_buffer( b_m, n_bm, REPORT_BM_PATTERN.findall( chunk, 0, end ) )
+	if tail:
+		cc, n_cc = append_to_buffer( cc, n_cc, REPORT_CC_PATTERN.findall( tail ) )
+		b_m, n_bm = append_to_buffer( b_m, n_bm, REPORT_BM_PATTERN.findall( tail ) )
+	return cc[ :n_cc ].copy(), b_m[ :n_bm ].copy()
+
+# Name of the sidecar file that caches the parsed "cc" and "b_m" columns next to a REPORT.
+REPORT_CACHE = "REPORT_cc_bm.npz"
+
+# Returns the fingerprint (size in bytes, modification time in ns) of a REPORT file.
+# path_to_report: The path to the REPORT or REPORT.gz file.
+def get_report_fingerprint( path_to_report ):
+	stat = os.stat( path_to_report )
+	return np.array( [ stat.st_size, stat.st_mtime_ns ], dtype = np.int64 )
+
+# Reads the "cc" and "b_m" columns of a REPORT file through the sidecar cache.
+# - The cache stores the arrays together with the name and fingerprint of the REPORT it was built from.
+# - The REPORT is parsed again (and the cache rewritten) only if its size or modification time changed.
+# - If the cache cannot be written (e.g. read-only directory) the parsed arrays are returned anyway.
+# path_to_report: The path to the REPORT or REPORT.gz file.
+# Returns: Two float64 NumPy arrays - one for "cc" and another for "b_m".
+def read_report_cached( path_to_report ):
+	cache = os.path.join( os.path.dirname( path_to_report ), REPORT_CACHE )
+	source = os.path.basename( path_to_report )
+	fingerprint = get_report_fingerprint( path_to_report )
+	if os.path.isfile( cache ):
+		try:
+			with np.load( cache ) as stored:
+				if str( stored[ "source" ] ) == source and np.array_equal( stored[ "fingerprint" ], fingerprint ):
+					return stored[ "cc" ], stored[ "b_m" ]
+		except ( OSError, KeyError, ValueError ):
+			pass
+	cc, b_m = read_report( path_to_report )
+	tmp = None
+	try:
+		handle, tmp = tempfile.mkstemp( dir = os.path.dirname( cache ), suffix = ".tmp" )
+		with os.fdopen( handle, "wb" ) as file:
+			np.savez( file, cc = cc, b_m = b_m, source = source, fingerprint = fingerprint )
+		os.replace( tmp, cache )
+	except OSError:
+		if tmp and os.path.isfile( tmp ):
+			os.remove( tmp )
+	return cc, b_m
+
 # Processes a "REPORT" file or "REPORT.gz" file to extract and parse lines containing "cc" and "b_m".
-# Returns: Two lists extracted from the file - one containing specific columns from lines with "cc" and another with "b_m".
-def get_cc_bm():
-	files = glob.glob( "REPORT*" )
-	if "REPORT" in files:
-		print( "REPORT found" )
-		with open( files[ 0 ], "rb" ) as file:
-			lines = file.readlines()
-		cc = [ line.decode( "utf-8", errors = "ignore" ).strip() for line in lines if b"cc" in line ]
-		b_m = [ line.decode( "utf-8", errors = "ignore" ).strip() for line in lines if b"b_m" in line ]
-	elif "REPORT.gz" in files:
-		with gzip.open( files[ 0 ], "rb" ) as file:
-			lines = file.readlines()
-		cc = [ line.decode( "utf-8", errors = "ignore" ).strip() for line in lines if b"cc" in line ]
-		b_m = [ line.decode( "utf-8", errors = "ignore" ).strip() for line in lines if b"b_m" in line ]
+# path: The directory containing the REPORT file. Default is None, which uses the current working directory.
+# use_cache: If True, the parsed columns are served from (and stored in) the REPORT_CACHE sidecar. Default is True.
+# verbose: If True, prints which REPORT file was found. Default is True.
+# Returns: Two NumPy arrays extracted from the file - one containing specific columns from lines with "cc" and another with "b_m".
+def get_cc_bm( path = None, use_cache = True, verbose = True ):
+	path = os.path.abspath( path or os.getcwd() )
+	reader = read_report_cached if use_cache else read_report
+	if os.path.isfile( os.path.join( path, "REPORT" ) ):
+		if verbose:
+			print( "REPORT found" )
+		return reader( os.path.join( path, "REPORT" ) )
+	elif os.path.isfile( os.path.join( path, "REPORT.gz" ) ):
+		return reader( os.path.join( path, "REPORT.gz" ) )
 	else:
-		print( "REPORT NOT found" )
-	df_cc = pd.DataFrame( [ row.split() for row in cc ] )
-	df_bm = pd.DataFrame( [ row.split() for row in b_m ] )
-	return list( df_cc[ 3 ] ), list( df_bm[ 1 ] )
+		if verbose:
+			print( "REPORT NOT found" )
+		return np.empty( 0 ), np.empty( 0 )
 
 # Collects and processes "cc" and "b_m" data from a specified directory containing SG calculations.
 # path_to_SG_calculation: The path to the directory containing SG calculation data.
-# Returns: Two lists of floats - one for "cc" and another for "b_m". Returns (None, None) if no valid data is found.
-def collect_cc_and_bm( path_to_SG_calculation ):
+# use_cache: If True, every RUN is read through its REPORT_CACHE sidecar. Default is True.
+# verbose: If True, prints the RUN directories and REPORT files that are read. Default is True.
+# The function only uses absolute paths and never changes the working directory, so it is safe to call from several threads.
+# Returns: Two float64 NumPy arrays - one for "cc" and another for "b_m". Returns (None, None) if no valid data is found.
+def collect_cc_and_bm( path_to_SG_calculation, use_cache = True, verbose = True ):
+	path_to_SG_calculation = os.path.abspath( path_to_SG_calculation )
 	if os.path.exists( path_to_SG_calculation ):
-		os.chdir( path_to_SG_calculation )
 		runs = get_RUNs( path_to_SG_calculation )
 		if not runs and not ( os.path.isfile( path_to_SG_calculation + "/OUTCAR" ) or os.path.isfile( path_to_SG_calculation + "/OUTCAR.gz" ) ):
 			return None, None
 		if not runs:
-			print( "No RUN directories" )
-			CC, B_M = get_cc_bm()
-			return [ float( i ) for i in  CC ], [ float( i ) for i in  B_M ]
+			if verbose:
+				print( "No RUN directories" )
+			return get_cc_bm( path_to_SG_calculation, use_cache, verbose )
 		else:
-			print( runs )
+			if verbose:
+				print( runs )
 			CC = list()
 			B_M = list()
-			for i in range( 0, len( runs ) ):
-				new_path = path_to_SG_calculation + "/RUN" + str( i + 1 )
-				os.chdir( new_path )
-				cc, b_m = get_cc_bm()
+			for run in runs:
+				cc, b_m = get_cc_bm( run, use_cache, verbose )
 				CC.append( cc )
 				B_M.append( b_m )
-			return [ float( i ) for i in flatten_matrix( CC ) ], [ float( i ) for i in flatten_matrix( B_M ) ]
+			return np.concatenate( CC ), np.concatenate( B_M )
+	else:
+		if verbose:
+			print( "Path not found" )
+		return None, None
+
+# Collects the "cc" and "b_m" data of several SG calculations concurrently with a thread pool.
+# gzip decompression and file reads release the GIL, so the reads of different simulations overlap.
+# paths_to_SG_calculations: A list of paths to SG calculation directories.
+# workers: The number of threads. Default is 8.
+# use_cache: If True, every RUN is read through its REPORT_CACHE sidecar. Default is True.
+# Returns: A dictionary mapping every path to its ( cc, b_m ) tuple, in the order of paths_to_SG_calculations.
+def collect_cc_and_bm_many( paths_to_SG_calculations, workers = 8, use_cache = True ):
+	with ThreadPoolExecutor( max_workers = workers ) as executor:
+		results = executor.map( lambda path: collect_cc_and_bm( path, use_cache, verbose = False ), paths_to_SG_calculations )
+		return dict( zip( paths_to_SG_calculations, results ) )
+
+# Integration schemes supported by integrate_free_energy.
+INTEGRATION_METHODS = ( "trapezoid", "simpson", "spline" )
+
+# Cumulatively integrates the constraint force "b_m" along the collective variable "cc".
+# - "trapezoid": cumulative trapezoidal rule, tg[ i ] = tg[ i - 1 ] + 0.5 * ( cc[ i ] - cc[ i - 1 ] ) * ( b_m[ i ] + b_m[ i - 1 ] ).
+# - "simpson": cumulative composite Simpson rule on the (possibly non-uniform) cc grid.
+# - "spline": exact antiderivative of a cubic spline through ( cc, b_m ).
+# "simpson" and "spline" require cc to be strictly monotonic.
+# cc: Array of collective variable values.
+# b_m: Array of constraint forces, same length as cc.
+# method: One of INTEGRATION_METHODS. Default is "trapezoid".
+# Returns: A float64 NumPy array with the free energy profile, starting at 0.
+# Raises: ValueError for mismatched inputs, unknown methods or non-monotonic cc with "simpson"/"spline".
+def integrate_free_energy( cc, b_m, method = "trapezoid" ):
+	cc = np.asarray( cc, dtype = np.float64 )
+	b_m = np.asarray( b_m, dtype = np.float64 )
+	if cc.shape != b_m.shape:
+		raise ValueError( "cc and b_m must have the same length." )
+	if method not in INTEGRATION_METHODS:
+		raise ValueError( "Unsupported integration method. Supported methods are: " + ", ".join( INTEGRATION_METHODS ) )
+	tg = np.zeros( len( cc ) )
+	if len( cc ) < 2:
+		return tg
+	steps = np.diff( cc )
+	if method == "trapezoid" or len( cc ) < 3:
+		np.cumsum( 0.5 * steps * ( b_m[ 1: ] + b_m[ :-1 ] ), out = tg[ 1: ] )
+		return tg
+	if not ( np.all( steps > 0 ) or np.all( steps < 0 ) ):
+		raise ValueError( f"The {method} integration requires strictly monotonic cc values." )
+	order = slice( None ) if steps[ 0 ] > 0 else slice( None, None, -1 )
+	if method == "simpson":
+		tg[ 1: ] = cumulative_simpson( b_m[ order ], x = cc[ order ] )
+		tg = tg[ order ] - tg[ order ][ 0 ]
 	else:
-		print( "Path not found" )
+		antiderivative = CubicSpline( cc[ order ], b_m[ order ] ).antiderivative()
+		tg = antiderivative( cc ) - antiderivative( cc[ 0 ] )
+	return tg
 
 # Computes the free energy (tg) based on the "cc" and "b_m" data from a specified SG calculation directory.
 # path_to_SG_calculation: The path to the directory containing SG calculation data.
-# Returns: Two lists - one for "cc" (cumulative charge) and another for "tg" (free energy). Returns (None, None) if no valid data is found.
-def get_free_energy( path_to_SG_calculation ):
-	tg = [ 0.0 ]
-	cc, b_m = collect_cc_and_bm( path_to_SG_calculation )
-	if ( not cc ) or ( not b_m ):
+# method: The integration scheme passed to integrate_free_energy. Default is "trapezoid".
+# Returns: Two NumPy arrays - one for "cc" (cumulative charge) and another for "tg" (free energy). Returns (None, None) if no valid data is found.
+# verbose: If True, prints the RUN directories and REPORT files that are read. Default is True.
+def get_free_energy( path_to_SG_calculation, method = "trapezoid", verbose = True ):
+	cc, b_m = collect_cc_and_bm( path_to_SG_calculation, verbose = verbose )
+	if cc is None or b_m is None or len( cc ) == 0 or len( b_m ) == 0:
 		return None, None
-	for i in range( 1, len( cc ) ):
-		gg = 0.5 * ( cc[ i ]  -  cc[ i - 1 ] ) * ( b_m[ i ]  +  b_m[ i - 1 ] )
-		tg.append( tg[ -1 ] + gg )
-	return cc, tg
+	return cc, integrate_free_energy( cc, b_m[ :len( cc ) ], method )
 
 # Calculates the energy barrier from the free energy data of an SG calculation directory.
 # path_to_SG_calculation: The path to the directory containing SG calculation data.
+# method: The integration scheme passed to get_free_energy. Default is "trapezoid".
 # Returns: The energy barrier (rounded to 2 decimal places) or None if free energy data is unavailable.
-def get_barrier( path_to_SG_calculation ):
+def get_barrier( path_to_SG_calculation, method = "trapezoid" ):
 	#do not allow printing from get free_energy() 
-    original_stdout = sys.stdout
-    sys.stdout = open( os.devnull, "w" )
-    try:
-        x, y = get_free_energy( path_to_SG_calculation )
-        if x == None or y == None:
-            return None
-        else:
-            barrier = round( max( y ) - min( y ), 2 )
-            return barrier
-    finally:
-            sys.stdout.close()
-            sys.stdout = original_stdout
+	x, y = get_free_energy( path_to_SG_calculation, method, verbose = False )
+	if x is None or y is None:
+		return None
+	else:
+		barrier = round( float( np.max( y ) - np.min( y ) ), 2 )
+		return barrier
+
+# Calculates the energy barriers of several SG calculations concurrently with a thread pool.
+# paths_to_SG_calculations: A list of paths to SG calculation directories.
+# workers: The number of threads. Default is 8.
+# method: The integration scheme passed to get_free_energy. Default is "trapezoid".
+# Returns: A dictionary mapping every path to its barrier (or None), in the order of paths_to_SG_calculations.
+def get_barriers( paths_to_SG_calculations, workers = 8, method = "trapezoid" ):
+	with ThreadPoolExecutor( max_workers = workers ) as executor:
+		results = executor.map( lambda path: get_barrier( path, method ), paths_to_SG_calculations )
+		return dict( zip( paths_to_SG_calculations, results ) )
 
 # Updates a dictionary with energy barrier values for a specific SG calculation path.
 # path_to_SG_calculation: The path to the SG calculation directory.
 # barriers_dict: The dictionary to store barrier values, keyed by the directory path. It is initally empty
 # Returns: The updated dictionary with the barrier value for the specified path.
 def get_barriers_to_dictionary( path_to_SG_calculation, barriers_dict ):
-	os.chdir( path_to_SG_calculation )
 	path_to_list = split_path( path_to_SG_calculation )
-	barrier = get_barriers( path_to_SG_calculation )
+	barrier = get_barrier( path_to_SG_calculation )
 	key = path_to_list[ -3 ] + "/" + path_to_list[ -2 ] +  "/" + path_to_list[ -1 ]
 	if barrier is None:
 		barriers_dict[ key ] = "Not started yet"
@@ -451,13 +678,23 @@ def get_barriers_to_dictionary( path_to_SG_calculation, barriers_dict ):
 
 ################################# FROM DATABASE #################################
 
-# Loads a JSON database from a specified file.
-# database_file: The path to the JSON file containing the database.
-# Returns: The loaded database as a Python dictionary.
+# Loads the database from a specified file.
+# database_file: The path to the JSON file ( database_for_theo.js ) or to the SQLite store ( database_for_theo.db ) containing the database.
+# Returns: The loaded database as a Python dictionary for a JSON file, or a SimulationDatabase for an SQLite file.
 def load_database( database_file ):
-	with open( database_file, "r" ) as file:
-		database = json.load( file )
-	return database
+	return open_database( database_file )
+
+# Saves the stored metrics of a database loaded with load_database, so the next process does not compute them again.
+# A SimulationDatabase is committed; a dictionary is written back to its JSON file ( through a temporary file, so an interrupted write never truncates it ).
+# database: The database as returned by load_database.
+# database_file: The JSON file the dictionary was loaded from. Ignored for a SimulationDatabase.
+def save_database( database, database_file ):
+	if isinstance( database, SimulationDatabase ):
+		database.commit()
+		return
+	with open( database_file + ".tmp", "w" ) as f:
+		json.dump( database, f, indent = 4, default = to_json )
+	os.replace( database_file + ".tmp", database_file )
 
 # Determines the auxiliary key based on the provided path key.
 # path_key: A string representing the specific path key.
@@ -474,20 +711,43 @@ def get_aux_key( path_key ):
 	else:
 		return None
 
+# One row of the barrier DataFrame, i.e. the processed data of one database entry.
+# The fields that are also columns of the SimulationDatabase ( METRIC_COLUMNS ) have the same names.
+# - CONF: f"bar_{aux_key}_{name}", the name of the simulation directory prefixed with its auxiliary key.
+# - barrier, D_H_Au, I_H_Au, D_O_cation, Min_D_O_H, Init_D_O_H, RUNS, I_O_H, ICONST: see RECORD_COLUMNS.
+#   barrier is None if the free energy cannot be computed; I_O_H is NaN for Na, which has no N-H hydrogen.
+# - status: The note of the database entry.
+@dataclasses.dataclass( slots = True )
+class BarrierRecord:
+	CONF: str
+	barrier: Optional[ float ] = None
+	D_H_Au: float = np.nan
+	I_H_Au: Optional[ str ] = None
+	D_O_cation: float = np.nan
+	Min_D_O_H: float = np.nan
+	Init_D_O_H: float = np.nan
+	RUNS: int = 0
+	I_O_H: Union[ str, float ] = np.nan
+	ICONST: Optional[ str ] = None
+	status: Optional[ str ] = None
+
+# Maps the fields of BarrierRecord to the columns of the barrier DataFrame, in the order of the columns.
+RECORD_COLUMNS = { "CONF": "CONF", "barrier": "barrier", "D_H_Au": "D(H-Au)", "I_H_Au": "I(H-Au)", "D_O_cation": "D(O-Na)", "Init_D_O_H": "Init_D(O-H)", "RUNS": "RUNS", "Min_D_O_H": "Min_D(O-H)", "I_O_H": "I(O-H)", "status": "status", "ICONST": "ICONST" }
+
 # Processes a single database entry and extracts relevant data.
 # value: A dictionary containing details about a specific database entry.
 # filtered_data: Unused parameter in the function, can be removed if unnecessary.
-# Returns: A dictionary of processed data and the ICONST index.
+# Returns: A BarrierRecord with the processed data, or None if there is nothing to report for the entry.
 def process_database_entry( value, filtered_data ):
 	path_key = value[ "path" ].split( "/" )[ -2 ]
 	aux_key = get_aux_key( path_key )
 	if not aux_key:
 		print( "Nothing to report here" )
-		return {}, None
+		return None
 
 	path_to_SG_simulation = convert( value[ "path" ] )
-	initial_system = get_initial_system( path_to_SG_simulation )
-	data_ICONST = get_data_ICONST( path_to_SG_simulation, verbose = False )
+	context = SimulationContext( path_to_SG_simulation )
+	data_ICONST = get_data_ICONST( context, verbose = False )
 
 	if len( data_ICONST ) == 2:
 		H_idx, O_idx = data_ICONST
@@ -507,63 +767,81 @@ def process_database_entry( value, filtered_data ):
 	else:
 		raise ValueError( "Unsupported cation type." )
 
-	min_cation_distance, closest_H_distance, H_bond_info = get_distances( path_to_SG_simulation, cation )
-	min_H_Au_dist, H_Au_idx = get_initial_H_Au_distance( path_to_SG_simulation )
-	initial_H_N_distance = get_initial_H_N_distance( path_to_SG_simulation )
-	runs = get_RUNs( path_to_SG_simulation )
+	min_cation_distance, closest_H_distance, H_bond_info = get_distances( context, cation )
+	min_H_Au_dist, H_Au_idx = get_initial_H_Au_distance( context )
+	initial_H_N_distance = get_initial_H_N_distance( context )
+	runs = context.runs
+
+	return BarrierRecord(
+		CONF = f"bar_{aux_key}_{value['path'].split( '/' )[ -1 ] }",
+		barrier = get_barrier( path_to_SG_simulation ),
+		D_H_Au = min_H_Au_dist,
+		I_H_Au = H_Au_idx,
+		D_O_cation = min_cation_distance,
+		Min_D_O_H = closest_H_distance,
+		Init_D_O_H = initial_H_N_distance,
+		RUNS = len( runs ) + 1,
+		I_O_H = H_bond_info,
+		ICONST = ICONST_idx,
+		status = value[ "note" ],
+	)
+
+# Runs process_database_entry for one entry inside a worker process.
+# value: A dictionary containing details about a specific database entry.
+# Returns: The same BarrierRecord ( or None ) as process_database_entry.
+def process_database_entry_worker( value ):
+	return process_database_entry( value, None )
 
-	updated_data = {
-		f"bar_{aux_key}_{value['path'].split( '/' )[ -1 ] }": get_barrier(path_to_SG_simulation),
-		f"Dist(H-Au)_{value['path'].split( '/' )[ -1 ] }": min_H_Au_dist,
-		f"Index(H-Au)_{value[ 'path' ].split( '/' )[ -1 ] }": H_Au_idx,
-		f"Dist(O-cation)_{aux_key}_{value[ 'path' ].split( '/' )[ -1 ] }": min_cation_distance,
-		f"Dist(O-H)_{aux_key}_{value[ 'path' ].split( '/' )[ -1 ] }": closest_H_distance,
-		f"Initial_Dist(O-H)_{aux_key}_{value[ 'path' ].split( '/' )[ -1 ] }": initial_H_N_distance,
-		f"RUNS_{aux_key}_{value[ 'path' ].split( '/' )[ -1 ] }": len( runs ) + 1,
-		f"Bond_data_{aux_key}_{value[ 'path' ].split( '/' )[ -1 ] }": H_bond_info,
-	}
-
-	return updated_data, ICONST_idx
-
-# Creates a pandas DataFrame from the filtered data.
-# filtered_data: A dictionary containing processed data.
-# status: A status label to be added to the DataFrame.
+# Bump when process_database_entry changes what it computes, so every stored record becomes stale.
+METRICS_VERSION = 2
+
+# Computes the provenance hash of the input files the derived metrics of a SG simulation are computed from:
+# the REPORT (or REPORT.gz) of every RUN, the initial POSCAR and the ICONST file, identified by their size and modification time.
+# path_to_SG_simulation: The path to the SG simulation directory.
+# Returns: A hexadecimal SHA-1 string. It changes when a RUN is added or any of these files is rewritten.
+def get_provenance_hash( path_to_SG_simulation ):
+	path_to_SG_simulation = os.path.abspath( path_to_SG_simulation )
+	runs = get_RUNs( path_to_SG_simulation )
+	files = [ get_ICONST_path( path_to_SG_simulation ), os.path.join( runs[ 0 ] if runs else path_to_SG_simulation, "POSCAR" ) ]
+	for run in runs or [ path_to_SG_simulation ]:
+		files += [ os.path.join( run, "REPORT" ), os.path.join( run, "REPORT.gz" ) ]
+	provenance = [ METRICS_VERSION ]
+	for f in files:
+		if os.path.isfile( f ):
+			stat = os.stat( f )
+			provenance.append( [ os.path.relpath( f, path_to_SG_simulation ), stat.st_size, stat.st_mtime_ns ] )
+	return hashlib.sha1( json.dumps( provenance ).encode() ).hexdigest()
+
+# Returns the METRIC_COLUMNS of the store for a BarrierRecord (or None).
+def get_metric_columns( record ):
+	if record is None:
+		return {}
+	return { column: getattr( record, column ) for column in METRIC_COLUMNS }
+
+# Processes several database entries, optionally in parallel with a process pool.
+# values: A list of database entries (dictionaries with "path" and "note").
+# workers: The number of worker processes. 1 processes the entries serially, None uses all available cores. Default is 1.
+# Returns: A list of BarrierRecord ( or None ) in the same order as values.
+def process_database_entries( values, workers = 1 ):
+	if workers == 1 or len( values ) < 2:
+		return [ process_database_entry_worker( value ) for value in values ]
+	with ProcessPoolExecutor( max_workers = workers ) as executor:
+		return list( executor.map( process_database_entry_worker, values ) )
+
+# Creates a pandas DataFrame from the processed records in one constructor call.
+# records: A list of BarrierRecord.
 # aux_key: A key to determine if specific data should be included.
-# Returns: A sorted pandas DataFrame based on barrier values.
-def create_dataframe( filtered_data, status, aux_key ):
-	data = pd.DataFrame()
-	names, barriers, distances_H_Au, index_H_Au, distances_O_cation, distances_O_H, initial_distances_H_O, bond_data, runs = [], [], [], [], [], [], [], [], []
-
-	for key in filtered_data:
-		if key.startswith( "bar" ):
-			names.append( key )
-			barriers.append( filtered_data[ key ] )
-		elif key.startswith( "Dist(H-Au)_" ):
-			distances_H_Au.append( filtered_data[ key ] )
-		elif key.startswith( "Index(H-Au)_" ):
-			index_H_Au.append( filtered_data[ key ] )
-		elif key.startswith( "Dist(O-cation)_" ):
-			distances_O_cation.append( filtered_data[ key ] )
-		elif key.startswith( "Dist(O-H)" ):
-			distances_O_H.append( filtered_data[ key ] )
-		elif key.startswith( "Initial_Dist(O-H)_" ):
-			initial_distances_H_O.append( filtered_data[ key ] )
-		elif key.startswith( "Bond_data_" ):
-			bond_data.append( filtered_data[ key ] )
-		elif key.startswith( "RUNS" ):
-			runs.append( filtered_data[ key ] )
-
-	data[ "CONF" ] = names
-	data[ "barrier" ] = barriers
-	data[ "D(H-Au)" ] = distances_H_Au
-	data[ "I(H-Au)" ] = index_H_Au
-	data[ "D(O-Na)" ] = distances_O_cation
-	data[ "Init_D(O-H)" ] = initial_distances_H_O
-	data[ "RUNS" ] = runs
-	if aux_key and "splitting" not in aux_key:
-		data[ "Min_D(O-H)" ] = distances_O_H
-	data[ "I(O-H)" ] = bond_data
-	data[ "status" ] = status
+# fixed_length: If given, the "CONF" entries are padded/truncated to this length. Default is None.
+# Returns: A pandas DataFrame with one row per record and the columns of RECORD_COLUMNS; "CONF" and "status" are categorical.
+def create_dataframe( records, aux_key, fixed_length = None ):
+	columns = { column: [ getattr( record, field ) for record in records ] for field, column in RECORD_COLUMNS.items() }
+	if fixed_length is not None:
+		columns[ "CONF" ] = [ x[ :fixed_length ].ljust( fixed_length ) for x in columns[ "CONF" ] ]
+	columns[ "CONF" ] = pd.Categorical( columns[ "CONF" ] )
+	columns[ "status" ] = pd.Categorical( columns[ "status" ], categories = [ "Good", "Bad" ] )
+	if not ( aux_key and "splitting" not in aux_key ):
+		del columns[ "Min_D(O-H)" ]
+	data = pd.DataFrame( columns )
 
 	pd.set_option( "display.colheader_justify", "left" )
 	data.style.set_properties( **{ "text-align": "center" } )
@@ -616,33 +894,68 @@ def get_sorted_data_cleaned( dataframe ):
 	return dataframe
 
 
-# Retrieves barrier data from the database and processes it into a structured DataFrame.
-# database: A dictionary containing the database with relevant entries.
-# val: The key for the specific dataset to be retrieved from the database.
-# fixed_length: The length to which the "CONF" column entries should be padded/truncated. Default is 45.
-# verbose: If True, prints the DataFrame. Default is False.
-# Returns: A sorted pandas DataFrame containing processed data, or None if no valid data is found.
-def get_barrier_from_db( database, val, fixed_length = 43, verbose = False ):
-	filtered_data = {}
-	status = list()
-	ICONST_indices = list()
-
-	for key, value in database[ val ].items():
-		if value[ "note" ] in [ "Good" ]:  #[ "Good", "Bad" ]:
-			status.append( value[ "note" ] )
-			updated_data, ICONST_idx = process_database_entry( value, filtered_data )
-			filtered_data.update( updated_data )
-			ICONST_indices.append( ICONST_idx )
-	path_key = value[ "path" ].split( "/" )[ -2 ]
-
-	if not filtered_data:
-		print( "No valid data found in database for:", val, "\n" )
-		return None
-
-	aux_key = get_aux_key( path_key )
-	sorted_data = create_dataframe( filtered_data, status, aux_key )
-	sorted_data[ "CONF" ] = sorted_data[ "CONF" ].apply( lambda x: x[ :fixed_length ].ljust( fixed_length ) )
-	sorted_data[ "ICONST" ] = ICONST_indices
+# Returns the "Good" entries of a category.
+# database: A dictionary or a SimulationDatabase.
+# val: The key of the category.
+# Returns: A list of entry dictionaries ( for a SimulationDatabase with their "category" and "name" ).
+def get_good_entries( database, val ):
+	if isinstance( database, SimulationDatabase ):
+		entries = database.query( val, note = "Good" )
+	else:
+		entries = database[ val ].values()
+	return [ value for value in entries if value[ "note" ] in [ "Good" ] ]  #[ "Good", "Bad" ]
+
+# Resolves category keys and glob patterns ( e.g. "3_*" ) to the category keys of the database.
+# categories: A category key, a glob pattern or a list of them.
+# Returns: A list of unique category keys, in the order they are first matched. Keys that are not in the database are kept, so they are reported as missing.
+def resolve_categories( database, categories ):
+	if isinstance( categories, str ):
+		categories = [ categories ]
+	keys = list( database.keys() )
+	resolved = list()
+	for pattern in categories:
+		matches = fnmatch.filter( keys, pattern ) if any( c in pattern for c in "*?[" ) else [ pattern ]
+		resolved += [ key for key in sorted( matches ) if key not in resolved ]
+	return resolved
+
+# Makes sure every entry has up-to-date derived metrics ( see get_provenance_hash ), processing every stale simulation only once.
+# The same simulation directory may be listed in several categories; it is processed once and its record is stored in all of them.
+# entries_by_category: A dictionary { category: list of entries } as returned by get_good_entries.
+# workers: The number of worker processes (see process_database_entries).
+# recompute: If True, every entry is processed again even if its stored metrics are up to date.
+def update_stored_metrics( database, entries_by_category, workers = 1, recompute = False ):
+	provenances = dict()
+	stale = dict()
+	for entries in entries_by_category.values():
+		for value in entries:
+			path = convert( value[ "path" ] )
+			if path not in provenances:
+				provenances[ path ] = get_provenance_hash( path )
+			if recompute or "metrics" not in value or value.get( "provenance" ) != provenances[ path ]:
+				stale.setdefault( path, value )
+	records = dict( zip( stale.keys(), process_database_entries( list( stale.values() ), workers ) ) )
+
+	for val, entries in entries_by_category.items():
+		for value in entries:
+			path = convert( value[ "path" ] )
+			if path not in records or ( value.get( "provenance" ) == provenances[ path ] and "metrics" in value and not recompute ):
+				continue
+			record = records[ path ]
+			metrics = dataclasses.asdict( record ) if record is not None else None
+			value[ "provenance" ] = provenances[ path ]
+			value[ "metrics" ] = metrics
+			if isinstance( database, SimulationDatabase ):
+				database.set_metrics( val, value[ "name" ], provenances[ path ], metrics, get_metric_columns( record ) )
+	if records and isinstance( database, SimulationDatabase ):
+		database.commit()
+
+# Turns the records of one category into the sorted and cleaned barrier table.
+# records: A list of BarrierRecord.
+# aux_key: The auxiliary key of the category (see get_aux_key).
+# fixed_length: The length to which the "CONF" column entries should be padded/truncated.
+# Returns: A sorted pandas DataFrame.
+def get_barrier_table( records, aux_key, fixed_length = 43 ):
+	sorted_data = create_dataframe( records, aux_key, fixed_length )
 
 	sorted_data = add_suggestions( sorted_data )
 	sorted_data = sorted_data.sort_values( by = "barrier" ).reset_index( drop = True )
@@ -654,73 +967,87 @@ def get_barrier_from_db( database, val, fixed_length = 43, verbose = False ):
 
 	sorted_data = get_sorted_data_cleaned( sorted_data )
 
-	if verbose:
-		print( sorted_data.to_string(), "\n")
-
 	return sorted_data
 
-if __name__ == "__main__":
-	path = "/home/theodoros/PROJ_ElectroCat/theodoros/HER/Au/HER_Au/database/"
-	data = load_database( path + "database_for_theo.js" )
-
-	#Na_1_hyd = get_barrier_from_db( data, "1_Na_H2O_dissociation_from_hydration_shell", verbose = True )
-
-	#Na_1_No_hyd = get_barrier_from_db( data, "1_Na_H2O_dissociation_NOT_from_hydration_shell", verbose = True )
-
-	Na_3_hyd = get_barrier_from_db( data, "3_Na_H2O_dissociation_from_hydration_shell", verbose = True )
-
-	Na_3_No_hyd = get_barrier_from_db( data, "3_Na_H2O_dissociation_NOT_from_hydration_shell", verbose = True )
-
-	#Na_5_hyd = get_barrier_from_db( data, "5_Na_H2O_dissociation_from_hydration_shell", verbose = True )
-
-	#Na_5_No_hyd = get_barrier_from_db( data, "5_Na_H2O_dissociation_NOT_from_hydration_shell", verbose = True )
-
-
-	#NH4_1_hyd = get_barrier_from_db( data, "1_NH4_H2O_dissociation_from_hydration_shell", verbose = True )
-
-	#NH4_1_NO_hyd = get_barrier_from_db( data, "1_NH4_H2O_dissociation_NOT_from_hydration_shell", verbose = True )
-
-	#NH4_1_splitting = get_barrier_from_db( data, "1_NH4_spliting", verbose = True )
-
-	#NH4_1_shuttling = get_barrier_from_db( data, "1_NH4_shuttling", verbose = True )
-
-	NH4_3_hyd = get_barrier_from_db( data, "3_NH4_H2O_dissociation_from_hydration_shell", verbose = True )
-
-	NH4_3_NO_hyd = get_barrier_from_db( data, "3_NH4_H2O_dissociation_NOT_from_hydration_shell", verbose = True )
-
-	NH4_3_splitting = get_barrier_from_db( data, "3_NH4_spliting", verbose = True )
-
-	NH4_3_shuttling = get_barrier_from_db( data, "3_NH4_shuttling", verbose = True )
-
-	#NH4_5_hyd = get_barrier_from_db( data, "5_NH4_H2O_dissociation_from_hydration_shell", verbose = True )
-
-	#NH4_5_NO_hyd = get_barrier_from_db( data, "5_NH4_H2O_dissociation_NOT_from_hydration_shell", verbose = True )
-
-	#NH4_5_splitting = get_barrier_from_db( data, "5_NH4_spliting", verbose = True )
+# Retrieves the barrier data of several categories at once.
+# - The categories are resolved with resolve_categories, so glob patterns such as "3_*" are allowed.
+# - The unique simulation directories of all categories are processed together in one process pool, and only if their stored metrics are stale.
+# database: A dictionary or a SimulationDatabase containing the database with relevant entries.
+# categories: A category key, a glob pattern or a list of them.
+# fixed_length: The length to which the "CONF" column entries should be padded/truncated. Default is 43.
+# verbose: If True, prints every DataFrame. Default is False.
+# workers: The number of worker processes used to process the entries (see process_database_entries). Default is 1.
+# recompute: If True, every entry is processed again even if its stored metrics are up to date. Default is False.
+# Returns: A dictionary mapping every resolved category to its sorted DataFrame, or to None if no valid data is found.
+def get_barriers_from_db( database, categories, fixed_length = 43, verbose = False, workers = 1, recompute = False ):
+	entries_by_category = dict()
+	for val in resolve_categories( database, categories ):
+		if val not in database:
+			print( "No valid data found in database for:", val, "\n" )
+			continue
+		entries_by_category[ val ] = get_good_entries( database, val )
+
+	update_stored_metrics( database, entries_by_category, workers, recompute )
+
+	tables = dict()
+	for val, good_values in entries_by_category.items():
+		records = [ BarrierRecord( **value[ "metrics" ] ) for value in good_values if value[ "metrics" ] is not None ]
+		if not records:
+			print( "No valid data found in database for:", val, "\n" )
+			tables[ val ] = None
+			continue
+		aux_key = get_aux_key( good_values[ -1 ][ "path" ].split( "/" )[ -2 ] )
+		tables[ val ] = get_barrier_table( records, aux_key, fixed_length )
+		if verbose:
+			print( tables[ val ].to_string(), "\n")
+	return tables
 
-	#NH4_5_shuttling = get_barrier_from_db( data, "5_NH4_shuttling", verbose = True )
-
-
-	#CH3NH3_1_hyd = get_barrier_from_db( data, "1_CH3NH3_H2O_dissociation_from_hydration_shell", verbose = True )
-
-	#CH3NH3_1_NO_hyd = get_barrier_from_db( data, "1_CH3NH3_H2O_dissociation_NOT_from_hydration_shell", verbose = True )
-
-	#CH3NH3_1_splitting = get_barrier_from_db( data, "1_CH3NH3_spliting", verbose = True )
-
-	#CH3NH3_1_shuttling = get_barrier_from_db( data, "1_CH3NH3_shuttling", verbose = True )
-
-	CH3NH3_3_hyd = get_barrier_from_db( data, "3_CH3NH3_H2O_dissociation_from_hydration_shell", verbose = True )
-
-	CH3NH3_3_NO_hyd = get_barrier_from_db( data, "3_CH3NH3_H2O_dissociation_NOT_from_hydration_shell", verbose = True )
-
-	CH3NH3_3_splitting = get_barrier_from_db( data, "3_CH3NH3_spliting", verbose = True )
-
-	CH3NH3_3_shuttling = get_barrier_from_db( data, "3_CH3NH3_shuttling", verbose = True )
-
-	#CH3NH3_5_hyd = get_barrier_from_db( data, "5_CH3NH3_H2O_dissociation_from_hydration_shell", verbose = True )
-
-	#CH3NH3_5_NO_hyd = get_barrier_from_db( data, "5_CH3NH3_H2O_dissociation_NOT_from_hydration_shell", verbose = True )
-
-	#CH3NH3_5_splitting = get_barrier_from_db( data, "5_CH3NH3_spliting", verbose = True )
+# Retrieves barrier data from the database and processes it into a structured DataFrame.
+# database: A dictionary or a SimulationDatabase containing the database with relevant entries.
+# val: The key for the specific dataset to be retrieved from the database.
+# fixed_length: The length to which the "CONF" column entries should be padded/truncated. Default is 45.
+# verbose: If True, prints the DataFrame. Default is False.
+# workers: The number of worker processes used to process the entries (see process_database_entries). Default is 1.
+# recompute: If True, every entry is processed again even if its stored metrics are up to date. Default is False.
+# The derived metrics of every entry are stored next to it with the provenance hash of its input files (see get_provenance_hash),
+# committed to the SimulationDatabase or, for a dictionary, only added to its entries in memory: call save_database to keep them
+# for the next process. Only stale entries are processed again.
+# Returns: A sorted pandas DataFrame containing processed data, or None if no valid data is found.
+def get_barrier_from_db( database, val, fixed_length = 43, verbose = False, workers = 1, recompute = False ):
+	return get_barriers_from_db( database, [ val ], fixed_length, verbose, workers, recompute ).get( val )
+
+# Consolidates the barrier data of several categories into one DataFrame and optionally writes it in a single step.
+# database, categories, fixed_length, verbose, workers, recompute: See get_barriers_from_db.
+# fout: The output file. ".parquet" files are written with DataFrame.to_parquet (requires pyarrow or fastparquet), anything else as CSV. Default is None (nothing is written).
+# Returns: A DataFrame with a ( category, row ) MultiIndex and the union of the columns of all categories, or None if no category has valid data.
+def get_barrier_report( database, categories, fixed_length = 43, verbose = False, workers = 1, recompute = False, fout = None ):
+	tables = get_barriers_from_db( database, categories, fixed_length, verbose, workers, recompute )
+	tables = { val: table for val, table in tables.items() if table is not None }
+	if not tables:
+		return None
+	#pd.concat turns categoricals with different categories into strings; cast them to the union of the categories first
+	for column in [ "CONF", "status" ]:
+		series = [ table[ column ] for table in tables.values() if column in table.columns ]
+		dtype = pd.CategoricalDtype( pd.api.types.union_categoricals( series ).categories )
+		tables = { val: table.astype( { column: dtype } ) if column in table.columns else table for val, table in tables.items() }
+	report = pd.concat( tables, names = [ "category", "row" ] )
+	if fout is not None:
+		if fout.endswith( ".parquet" ):
+			report.to_parquet( fout )
+		else:
+			report.to_csv( fout )
+	return report
 
-	#CH3NH3_5_shuttling = get_barrier_from_db( data, "5_CH3NH3_shuttling", verbose = True )
+if __name__ == "__main__":
+	path = "/home/theodoros/PROJ_ElectroCat/theodoros/HER/Au/HER_Au/database/"
+	database_file = path + "database_for_theo.db"
+	if not os.path.isfile( database_file ):
+		database_file = path + "database_for_theo.js"
+	data = load_database( database_file )
+	workers = os.cpu_count()
+
+	#One batch for all categories: every simulation is processed once, in parallel, and only if its stored metrics are stale.
+	#categories can be category keys or glob patterns, e.g. [ "1_Na_*", "5_NH4_spliting" ]; the 3_* categories are:
+	#3_Na_H2O_dissociation_(NOT_)from_hydration_shell, 3_NH4/3_CH3NH3_H2O_dissociation_(NOT_)from_hydration_shell, 3_NH4/3_CH3NH3_spliting and 3_NH4/3_CH3NH3_shuttling
+	report = get_barrier_report( data, [ "3_*" ], verbose = True, workers = workers, fout = "barriers_3.csv" )
+	save_database( data, database_file )
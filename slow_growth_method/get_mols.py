@@ -3,21 +3,144 @@ import glob
 import pandas as pd
 import numpy as np
 from ase.io import read
+from ase.neighborlist import neighbor_list
+from ase.geometry import get_distances
 from scipy.spatial.distance import cdist
+from simulation_context import SimulationContext
+
+# Returns the atomic structure of a source.
+# source: A SimulationContext (its already parsed initial system is reused), a path to a structure file or a directory containing POSCAR.
+def get_system( source ):
+	if isinstance( source, SimulationContext ):
+		return source.system
+	if os.path.isdir( source ):
+		return read( os.path.join( source, "POSCAR" ) )
+	return read( source )
+
+################################## Bond graph ##################################
+
+# Bond length (in Angstrom) below which a carbon is considered bonded to the nitrogen of CH3NH3.
+CN_BOND_THRESHOLD = 1.55
+
+# Builds the bond graph of the whole cell with a single periodic neighbor-list (cell list) query.
+# Distances follow the minimum image convention, as system.get_distances( ..., mic = True ) does.
+# system: The atomic structure.
+# cutoff: The largest bond length of interest.
+# Returns: Three NumPy arrays ( first, second, distance ) with every pair closer than cutoff, listed in both directions.
+def get_bond_graph( system, cutoff ):
+	first, second, distance = neighbor_list( "ijd", system, cutoff )
+	return first, second, distance
+
+# Extracts, from a bond graph, the atoms of one element bonded to each atom of another element.
+# system: The atomic structure the bond graph was built for.
+# bond_graph: The ( first, second, distance ) arrays returned by get_bond_graph.
+# center_symbol: The element of the central atoms (e.g. "O", "N", "C").
+# partner_symbol: The element of the bonded atoms (e.g. "H", "C").
+# threshold: The bond length threshold (strictly smaller distances are bonds).
+# Returns: A dictionary mapping every center_symbol index (ascending) to the ascending list of bonded partner_symbol indices.
+def get_bonded_atoms( system, bond_graph, center_symbol, partner_symbol, threshold ):
+	first, second, distance = bond_graph
+	symbols = np.array( system.get_chemical_symbols() )
+	mask = ( distance < threshold ) & ( symbols[ first ] == center_symbol ) & ( symbols[ second ] == partner_symbol )
+	pairs = np.unique( first[ mask ] * len( system ) + second[ mask ] )
+	bonded = { int( i ): list() for i in np.flatnonzero( symbols == center_symbol ) }
+	for center, partner in zip( pairs // len( system ), pairs % len( system ) ):
+		bonded[ int( center ) ].append( int( partner ) )
+	return bonded
+
+# Assigns the H2O molecules from a bond graph: every O bonded to exactly two H.
+# Returns: A list of [ H1, O, H2 ] index lists.
+def get_H2O_from_bond_graph( system, bond_graph, threshold = 1.2 ):
+	O_H = get_bonded_atoms( system, bond_graph, "O", "H", threshold )
+	return [ [ hydrogens[ 0 ], i, hydrogens[ 1 ] ] for i, hydrogens in O_H.items() if len( hydrogens ) == 2 ]
+
+# Assigns the NH4 molecules from a bond graph: every N bonded to exactly four H.
+# Returns: A list of [ N, H1, H2, H3, H4 ] index lists.
+def get_NH4_from_bond_graph( system, bond_graph, threshold = 1.2 ):
+	N_H = get_bonded_atoms( system, bond_graph, "N", "H", threshold )
+	return [ [ i ] + hydrogens for i, hydrogens in N_H.items() if len( hydrogens ) == 4 ]
+
+# Assigns the CH3NH3 molecules from a bond graph: every N bonded to exactly three H and one C, which is itself bonded to exactly three H.
+# Returns: A list of [ N, H1, H2, H3, C, H4, H5, H6 ] index lists.
+def get_CH3NH3_from_bond_graph( system, bond_graph, threshold = 1.2 ):
+	N_H = get_bonded_atoms( system, bond_graph, "N", "H", threshold )
+	N_C = get_bonded_atoms( system, bond_graph, "N", "C", CN_BOND_THRESHOLD )
+	C_H = get_bonded_atoms( system, bond_graph, "C", "H", threshold )
+	CH3NH3_mols = list()
+	for i, hydrogens in N_H.items():
+		if len( hydrogens ) == 3 and len( N_C[ i ] ) == 1 and len( C_H[ N_C[ i ][ 0 ] ] ) == 3:
+			CH3NH3_mols.append( [ i ] + hydrogens + N_C[ i ] + C_H[ N_C[ i ][ 0 ] ] )
+	return CH3NH3_mols
+
+################################## Batched distances ##################################
+
+# Computes the distance matrix between two groups of atoms with the minimum image convention.
+# system: The atomic structure (its cell and pbc are used).
+# indices_a: A list or array of atom indices (rows).
+# indices_b: A list or array of atom indices (columns).
+# Returns: A ( len( indices_a ), len( indices_b ) ) NumPy array of distances.
+def get_mic_distance_matrix( system, indices_a, indices_b ):
+	indices_a = np.asarray( indices_a, dtype = int ).reshape( -1 )
+	indices_b = np.asarray( indices_b, dtype = int ).reshape( -1 )
+	if len( indices_a ) == 0 or len( indices_b ) == 0:
+		return np.empty( ( len( indices_a ), len( indices_b ) ) )
+	_, distances = get_distances( system.positions[ indices_a ], system.positions[ indices_b ], cell = system.cell, pbc = system.pbc )
+	return distances
+
+# Nearest surface atom kernel: finds the closest surface atom of many query atoms in one batched call (minimum image convention).
+# system: The atomic structure.
+# indices: A list or array of query atom indices (a single index is also accepted).
+# surface_symbol: The element of the surface. Default is "Au".
+# surface_indices: The indices of the surface atoms. Default is None, which takes every surface_symbol atom of the system.
+# Returns: Two NumPy arrays - the minimum distance and the index of the closest surface atom, one entry per query atom.
+def get_nearest_surface_atom( system, indices, surface_symbol = "Au", surface_indices = None ):
+	if surface_indices is None:
+		surface_indices = np.flatnonzero( np.array( system.get_chemical_symbols() ) == surface_symbol )
+	surface_indices = np.asarray( surface_indices, dtype = int )
+	distances = get_mic_distance_matrix( system, indices, surface_indices )
+	closest = np.argmin( distances, axis = 1 )
+	return distances[ np.arange( len( closest ) ), closest ], surface_indices[ closest ]
+
+# Computes, in one batched pass, everything the hydration-shell helpers need.
+# system: The atomic structure.
+# H2O_mols: A list of [ H1, O, H2 ] index lists.
+# center_indices: The indices of the central atom of every cation (Na, or N of NH4/CH3NH3).
+# Returns:
+# - H2O: A ( n_H2O, 3 ) integer array with the H2O molecules.
+# - center_O: A ( n_cations, n_H2O ) array with the cation - O distances.
+# - closest_au: A ( n_H2O, 2 ) array with the closest Au atom of H1 and H2.
+# - au_distances: A ( n_H2O, 2 ) array with the H1 - Au and H2 - Au distances.
+def get_hydration_shell_data( system, H2O_mols, center_indices ):
+	H2O = np.asarray( H2O_mols, dtype = int ).reshape( -1, 3 )
+	center_O = get_mic_distance_matrix( system, center_indices, H2O[ :, 1 ] )
+	au_distances, closest_au = get_nearest_surface_atom( system, H2O[ :, [ 0, 2 ] ] )
+	return H2O, center_O, closest_au.reshape( -1, 2 ), au_distances.reshape( -1, 2 )
+
+# Builds the records of the H2O molecules outside every cation hydration shell.
+# system: The atomic structure.
+# H2O_mols: A list of [ H1, O, H2 ] index lists.
+# center_indices: The indices of the central atom of every cation.
+# distance_threshold: The cation - O distance up to which a H2O belongs to a hydration shell.
+# Returns: A list of dictionaries ( "H2O", "H1-Au1" distance, "H2-Au2" distance ) in the order of H2O_mols.
+def get_non_hydration_shell_records( system, H2O_mols, center_indices, distance_threshold ):
+	H2O, center_O, closest_au, au_distances = get_hydration_shell_data( system, H2O_mols, center_indices )
+	outside = ~np.any( center_O <= distance_threshold, axis = 0 )
+	non_hydration_H2O = list()
+	for k in np.flatnonzero( outside ):
+		h1_idx, o_idx, h2_idx = ( int( i ) for i in H2O[ k ] )
+		non_hydration_H2O.append({
+			"H2O": [ h1_idx, o_idx, h2_idx ],
+			f"{h1_idx}-{closest_au[ k, 0 ]}": round( au_distances[ k, 0 ], 3 ),
+			f"{h2_idx}-{closest_au[ k, 1 ]}": round( au_distances[ k, 1 ], 3 )
+		})
+	return non_hydration_H2O
 
 ################################## H2O molecules ##################################
 
 #H2O molecules in the system
 def get_H2O_mols( poscar, threshold = 1.2, verbose = False ):
-	system = read( poscar )
-	oxigen_indices = [ i for i, j in enumerate( system ) if j.symbol == "O" ]
-	hydrogen_indices = [ i for i, j in enumerate( system ) if j.symbol == "H" ]
-	H2O_mols = list()
-	for i in oxigen_indices:
-		distances = system.get_distances( i, hydrogen_indices, mic = True )
-		close_hydrogens = [ hydrogen_indices[ i ] for i, j in enumerate( distances ) if j < threshold ]
-		if len( close_hydrogens ) == 2:
-			H2O_mols.append( [ close_hydrogens[ 0 ], i, close_hydrogens[ 1 ] ] )
+	system = get_system( poscar )
+	H2O_mols = get_H2O_from_bond_graph( system, get_bond_graph( system, threshold ), threshold )
 	if verbose:
 		print( H2O_mols )
 	return ( H2O_mols )
@@ -26,7 +149,7 @@ def get_H2O_mols( poscar, threshold = 1.2, verbose = False ):
 #For H2O dissociation (best)
 #H2O -> OH + H*
 def get_H2O_within_surface_threshold( poscar, H2O_mols, distance_threshold = 2.6 ):
-	system = read( poscar )
+	system = get_system( poscar )
 	au_indices = [ i for i, atom in enumerate( system ) if atom.symbol == "Au" ]
 	au_positions = system.positions[au_indices]
 
@@ -56,7 +179,7 @@ def get_H2O_within_surface_threshold( poscar, H2O_mols, distance_threshold = 2.6
 
 #Na molecules in the system
 def get_Na_mols( path_to_poscar, verbose = False ):
-	system = read( os.path.join( path_to_poscar, "POSCAR") )
+	system = get_system( path_to_poscar )
 	na_indices = [  [ i ]  for i, atom in enumerate( system ) if atom.symbol == "Na" ]
 	if verbose:
 		print( na_indices )
@@ -65,32 +188,21 @@ def get_Na_mols( path_to_poscar, verbose = False ):
 #Get H2O mols in the Na hydration shell 
 #H2O -> OH + H*
 def get_Na_hydration_shell(poscar, H2O_mols, Na_atoms, distance_threshold=2.6, verbose = False ):
-	system = read(poscar)
-	au_indices = [i for i, atom in enumerate(system) if atom.symbol == "Au"]
-	au_positions = system.positions[au_indices]
+	system = get_system( poscar )
+	na_centers = [ np.ravel( na_idx )[ 0 ] for na_idx in Na_atoms ]
+	H2O, Na_O, closest_au, au_distances = get_hydration_shell_data( system, H2O_mols, na_centers )
 
 	final_results = list()
 
-	for na_idx in Na_atoms:
+	for row, na_idx in enumerate( Na_atoms ):
 		molecule_results = list()
 
-		for h2o in H2O_mols:
-			h1_idx, o_idx, h2_idx = h2o
-
-			distance_to_oxygen = np.linalg.norm(system.positions[o_idx] - system.positions[na_idx])
-			if distance_to_oxygen > distance_threshold:
-				continue
-
-			distances_h1_to_au = cdist([system.positions[h1_idx]], au_positions).flatten()
-			distances_h2_to_au = cdist([system.positions[h2_idx]], au_positions).flatten()
-
-			min_h1_distance_to_au = np.min(distances_h1_to_au)
-			min_h2_distance_to_au = np.min(distances_h2_to_au)
-
-			closest_au_h1_idx = au_indices[np.argmin(distances_h1_to_au)]
-			closest_au_h2_idx = au_indices[np.argmin(distances_h2_to_au)]
+		for k in np.flatnonzero( Na_O[ row ] <= distance_threshold ):
+			h1_idx, o_idx, h2_idx = ( int( i ) for i in H2O[ k ] )
+			closest_au_h1_idx, closest_au_h2_idx = ( int( i ) for i in closest_au[ k ] )
+			min_h1_distance_to_au, min_h2_distance_to_au = au_distances[ k ]
 
-			molecule_results.append({ "[Na]": [na_idx], "[H1, O, H2]": [h1_idx, o_idx, h2_idx], "[Au]": [closest_au_h1_idx, closest_au_h2_idx], "[H1 - Au]": [f"{h1_idx} - {closest_au_h1_idx} = {round(min_h1_distance_to_au, 3)}"], "[H2 - Au]": [f"{h2_idx} - {closest_au_h2_idx} = {round(min_h2_distance_to_au, 3)}"], "[Na - O H2O]": round(distance_to_oxygen, 3), } )
+			molecule_results.append({ "[Na]": [na_idx], "[H1, O, H2]": [h1_idx, o_idx, h2_idx], "[Au]": [closest_au_h1_idx, closest_au_h2_idx], "[H1 - Au]": [f"{h1_idx} - {closest_au_h1_idx} = {round(min_h1_distance_to_au, 3)}"], "[H2 - Au]": [f"{h2_idx} - {closest_au_h2_idx} = {round(min_h2_distance_to_au, 3)}"], "[Na - O H2O]": round(Na_O[ row, k ], 3), } )
 
 		molecule_results.sort(key=lambda x: float(x["[H1 - Au]"][0].split(" = ")[1]))
 		final_results.extend( molecule_results )
@@ -105,29 +217,9 @@ def get_Na_hydration_shell(poscar, H2O_mols, Na_atoms, distance_threshold=2.6, v
 #Get H2O mols NOT in the Na hydration shell 
 #H2O -> OH + H*
 def get_non_Na_hydration_shell( poscar, H2O_mols, Na_atoms, distance_threshold = 2.7, verbose = False ):
-    system = read( poscar )
-    au_indices = [ i for i, atom in enumerate( system ) if atom.symbol == "Au" ]
-    au_positions = system.positions[ au_indices ]
-    non_hydration_H2O = list()
-
-    for h2o in H2O_mols:
-        h1_idx, o_idx, h2_idx = h2o
-        is_in_hydration_shell = any(
-            np.linalg.norm( system.positions[ o_idx ] - system.positions[ na_idx ] ) <= distance_threshold
-            for na_idx in Na_atoms
-        )
-        if not is_in_hydration_shell:
-            distances_h1_to_au = cdist( [ system.positions[ h1_idx ] ], au_positions ).flatten()
-            distances_h2_to_au = cdist( [ system.positions[ h2_idx ] ], au_positions ).flatten()
-            closest_au_h1_idx = au_indices[ np.argmin( distances_h1_to_au ) ]
-            closest_au_h2_idx = au_indices[ np.argmin( distances_h2_to_au ) ]
-            min_h1_distance_to_au = np.min( distances_h1_to_au )
-            min_h2_distance_to_au = np.min( distances_h2_to_au )
-            non_hydration_H2O.append({
-                "H2O": [ h1_idx, o_idx, h2_idx ],
-                f"{h1_idx}-{closest_au_h1_idx}": round( min_h1_distance_to_au, 3 ),
-                f"{h2_idx}-{closest_au_h2_idx}": round( min_h2_distance_to_au, 3 )
-            })
+    system = get_system( poscar )
+    na_centers = [ np.ravel( na_idx )[ 0 ] for na_idx in Na_atoms ]
+    non_hydration_H2O = get_non_hydration_shell_records( system, H2O_mols, na_centers, distance_threshold )
     sorted_list = sorted( non_hydration_H2O, key=lambda d: list(d.values() )[ 1 ] )
     if verbose:
         print( "H2O molecules not in Na hydration shell:" )
@@ -140,16 +232,8 @@ def get_non_Na_hydration_shell( poscar, H2O_mols, Na_atoms, distance_threshold =
 
 #NH4 molecules in the system
 def get_NH4_mols( path_to_poscar, threshold = 1.2, verbose = False ):
-	system = read( os.path.join( path_to_poscar, "POSCAR") )
-	nitrogen_indices = [i for i, j in enumerate( system ) if j.symbol == "N" ]
-	hydrogen_indices = [i for i, j in enumerate( system ) if j.symbol == "H" ]
-
-	NH4_mols = list()
-	for i in nitrogen_indices:
-		distances = system.get_distances( i , hydrogen_indices, mic = True )
-		close_hydrogens = [ hydrogen_indices[ i ] for i, j in enumerate( distances ) if j < threshold ]
-		if len( close_hydrogens ) == 4:
-			NH4_mols.append( [ i ] + close_hydrogens )
+	system = get_system( path_to_poscar )
+	NH4_mols = get_NH4_from_bond_graph( system, get_bond_graph( system, threshold ), threshold )
 	if verbose:
 		print( NH4_mols )
 	return NH4_mols
@@ -158,7 +242,7 @@ def get_NH4_mols( path_to_poscar, threshold = 1.2, verbose = False ):
 #For NH4 split
 #NH4 -> NH3 + H*
 def get_NH4_within_surface_threshold(poscar, NH4_mols, distance_threshold = 5.6, verbose = False ):
-	system = read( poscar )
+	system = get_system( poscar )
 	au_indices = [ i for i, atom in enumerate(system) if atom.symbol == "Au" ]
 	au_positions = system.positions[ au_indices ]
 	NH4_close_to_electrode = list()
@@ -193,47 +277,27 @@ def get_NH4_within_surface_threshold(poscar, NH4_mols, distance_threshold = 5.6,
 #H2O molecules that belong to NH4 hydration shell
 #For H2O dissociation ( H2O -> OH + H* ) if H of H2O is close to electrode
 def get_NH4_hydration_shell( poscar, H2O_mols, NH4_molecules, distance_threshold = 3.1, verbose = False ):
-	system = read( poscar )
-	au_indices = [ i for i, atom in enumerate( system ) if atom.symbol == "Au" ]
-	au_positions = system.positions[ au_indices ]
+	system = get_system( poscar )
+	H2O, N_O, closest_au, au_distances = get_hydration_shell_data( system, H2O_mols, [ nh4[ 0 ] for nh4 in NH4_molecules ] )
 
 	final_results = list()
 
-	for nh4 in NH4_molecules:
+	for row, nh4 in enumerate( NH4_molecules ):
 		n_idx, h1_nh4_idx, h2_nh4_idx, h3_nh4_idx, h4_nh4_idx = nh4
 
 		molecule_results = list()
 
-		for h2o in H2O_mols:
-			h1_idx, o_idx, h2_idx = h2o
-
-			distance_n_to_o = np.linalg.norm( system.positions[ n_idx ] - system.positions[ o_idx ] )
-
-			if distance_n_to_o > distance_threshold:
-				continue
-
-			distances_h1_to_au = cdist( [ system.positions[ h1_idx ] ], au_positions ).flatten()
-			distances_h2_to_au = cdist( [ system.positions[ h2_idx ] ], au_positions ).flatten()
-
-			min_h1_distance_to_au = np.min( distances_h1_to_au )
-			min_h2_distance_to_au = np.min( distances_h2_to_au )
-
-			closest_au1_idx = au_indices[ np.argmin(distances_h1_to_au ) ]
-			closest_au2_idx = au_indices[ np.argmin(distances_h2_to_au ) ]
-
-			n_attached_h_distances = {}
-			for h_idx in [h1_nh4_idx, h2_nh4_idx, h3_nh4_idx, h4_nh4_idx]:
-				distances_to_au = cdist( [ system.positions[ h_idx ] ], au_positions ).flatten()
-				min_distance_to_au = np.min( distances_to_au )
-				closest_au_idx = au_indices[ np.argmin(distances_to_au ) ]
-				n_attached_h_distances[ f"H-Au" ] = f"{h_idx} - {closest_au_idx} = {round(min_distance_to_au, 3)}"
+		for k in np.flatnonzero( N_O[ row ] <= distance_threshold ):
+			h1_idx, o_idx, h2_idx = ( int( i ) for i in H2O[ k ] )
+			closest_au1_idx, closest_au2_idx = ( int( i ) for i in closest_au[ k ] )
+			min_h1_distance_to_au, min_h2_distance_to_au = au_distances[ k ]
 
 			molecule_results.append({
 				"[N, H1, H2, H3, H4]": [ n_idx, h1_nh4_idx, h2_nh4_idx, h3_nh4_idx, h4_nh4_idx ],
 				"[H1, O, H2]": [ h1_idx, o_idx, h2_idx ],
 				"H1-Au1": f"{h1_idx} - {closest_au1_idx} = {round(min_h1_distance_to_au, 3)}",
 				"H2-Au2": f"{h2_idx} - {closest_au2_idx} = {round(min_h2_distance_to_au, 3)}",
-				"N-O Distance": round( distance_n_to_o, 3 )
+				"N-O Distance": round( N_O[ row, k ], 3 )
 			})
 
 		molecule_results.sort( key=lambda x: x[ "N-O Distance" ] )
@@ -249,40 +313,8 @@ def get_NH4_hydration_shell( poscar, H2O_mols, NH4_molecules, distance_threshold
 #H2O molecules that not belong to NH4 hydration shel
 #H2O -> OH + H*
 def get_non_NH4_hydration_shell( poscar, H2O_mols, NH4_molecules, distance_threshold = 3.2, verbose = False ):
-	system = read( poscar )
-	au_indices = [ i for i, atom in enumerate( system ) if atom.symbol == "Au" ]
-	au_positions = system.positions[ au_indices ]
-
-	non_hydration_H2O = list()
-
-	for h2o in H2O_mols:
-		h1_idx, o_idx, h2_idx = h2o
-		is_in_hydration_shell = False
-
-		for nh4 in NH4_molecules:
-			n_idx, h1_nh4, h2_nh4, h3_nh4, h4_nh4 = nh4
-
-			distance_n_to_o = np.linalg.norm(system.positions[n_idx] - system.positions[o_idx])
-
-			if distance_n_to_o <= distance_threshold:
-				is_in_hydration_shell = True
-				break
-
-		if not is_in_hydration_shell:
-			distances_h1_to_au = cdist([system.positions[h1_idx]], au_positions).flatten()
-			distances_h2_to_au = cdist([system.positions[h2_idx]], au_positions).flatten()
-
-			closest_au_h1_idx = au_indices[np.argmin(distances_h1_to_au)]
-			closest_au_h2_idx = au_indices[np.argmin(distances_h2_to_au)]
-
-			min_h1_distance_to_au = np.min(distances_h1_to_au)
-			min_h2_distance_to_au = np.min(distances_h2_to_au)
-
-			non_hydration_H2O.append({
-				"H2O": [h1_idx, o_idx, h2_idx],
-				f"{h1_idx}-{closest_au_h1_idx}": round(min_h1_distance_to_au, 3),
-				f"{h2_idx}-{closest_au_h2_idx}": round(min_h2_distance_to_au, 3)
-			})
+	system = get_system( poscar )
+	non_hydration_H2O = get_non_hydration_shell_records( system, H2O_mols, [ nh4[ 0 ] for nh4 in NH4_molecules ], distance_threshold )
 
 	sorted_list = sorted(non_hydration_H2O, key=lambda d: list(d.values())[1])
 
@@ -296,7 +328,7 @@ def get_non_NH4_hydration_shell( poscar, H2O_mols, NH4_molecules, distance_thres
 #H2O molecules that belong to NH4 hydration shell
 #For shuttling
 def get_NH4_hydration_shell_shuttling( poscar, H2O_mols, NH4_molecules, distance_threshold = 2.6, verbose = False ):
-	system = read( poscar )
+	system = get_system( poscar )
 	au_indices = [ i for i, atom in enumerate( system ) if atom.symbol == "Au" ]
 	au_positions = system.positions[ au_indices ]
 
@@ -370,22 +402,9 @@ def get_NH4_hydration_shell_shuttling( poscar, H2O_mols, NH4_molecules, distance
 
 #CH3NH3 molecules in the system
 def get_CH3NH3_mols( path_to_poscar, threshold = 1.2, verbose = False ):
-	system = read( os.path.join( path_to_poscar, "POSCAR") )
-	nitrogen_indices = [ i for i, j in enumerate(system) if j.symbol == "N" ]
-	hydrogen_indices = [ i for i, j in enumerate(system) if j.symbol == "H" ]
-	carbon_indices = [ i for i, j in enumerate(system) if j.symbol == "C" ]
-	CH3NH3_mols = list()
-	for i in nitrogen_indices:
-		distances = system.get_distances( i, hydrogen_indices, mic=True )
-		close_hydrogens = [ hydrogen_indices[ i ] for i, j in enumerate( distances ) if j < threshold ]
-		if len( close_hydrogens ) == 3:
-			distances_to_carbon = system.get_distances( i, carbon_indices, mic = True )
-			close_carbon = [ carbon_indices[ i ] for i, j in enumerate( distances_to_carbon ) if j < 1.55 ]
-			if len( close_carbon ) == 1:
-				distances_to_hydrogen_from_carbon = system.get_distances(close_carbon[0], hydrogen_indices, mic=True)
-				close_hydrogens_from_carbon = [ hydrogen_indices[ i ] for i, j in enumerate( distances_to_hydrogen_from_carbon ) if j < threshold ]
-				if len( close_hydrogens_from_carbon ) == 3:
-					CH3NH3_mols.append( [ i ] + close_hydrogens + close_carbon + close_hydrogens_from_carbon )
+	system = get_system( path_to_poscar )
+	bond_graph = get_bond_graph( system, max( threshold, CN_BOND_THRESHOLD ) )
+	CH3NH3_mols = get_CH3NH3_from_bond_graph( system, bond_graph, threshold )
 	if verbose:
 		print( "CH3NH3_mols = ", CH3NH3_mols )
 	return CH3NH3_mols
@@ -394,7 +413,7 @@ def get_CH3NH3_mols( path_to_poscar, threshold = 1.2, verbose = False ):
 ##For CH3NH3 dissociation (best)
 #CH3NH3 -> CH3NH2 + H*
 def get_CH3NH3_within_surface_threshold(poscar, CH3NH3_mols, verbose = False ):
-	system = read( poscar )
+	system = get_system( poscar )
 	au_indices = [ i for i, atom in enumerate( system ) if atom.symbol == "Au" ]
 	au_positions = system.positions[ au_indices ]
 
@@ -435,47 +454,27 @@ def get_CH3NH3_within_surface_threshold(poscar, CH3NH3_mols, verbose = False ):
 #For shuttling
 #For H2O -> OH + H* if H of H2O is close to electrode
 def get_CH3NH3_hydration_shell(poscar, H2O_mols, CH3NH3_molecules, distance_threshold = 3.2, verbose = False ):
-	system = read( poscar )
-	au_indices = [ i for i, atom in enumerate( system ) if atom.symbol == "Au" ]
-	au_positions = system.positions[ au_indices ]
+	system = get_system( poscar )
+	H2O, N_O, closest_au, au_distances = get_hydration_shell_data( system, H2O_mols, [ ch3nh3[ 0 ] for ch3nh3 in CH3NH3_molecules ] )
 
 	final_results = list()
 
-	for ch3nh3 in CH3NH3_molecules:
+	for row, ch3nh3 in enumerate( CH3NH3_molecules ):
 		n_idx, h1_nh3_idx, h2_nh3_idx, h3_nh3_idx, c_idx, h4_nh3_idx, h5_nh3_idx, h6_nh3_idx = ch3nh3
 
 		molecule_results = list()
 
-		for h2o in H2O_mols:
-			h1_idx, o_idx, h2_idx = h2o
-
-			distance_n_to_o = np.linalg.norm( system.positions[ n_idx ] - system.positions[ o_idx ] )
-
-			if distance_n_to_o > distance_threshold:
-				continue
-
-			distances_h1_to_au = cdist( [ system.positions[ h1_idx ] ], au_positions ).flatten()
-			distances_h2_to_au = cdist( [ system.positions[ h2_idx ] ], au_positions ).flatten()
-
-			min_h1_distance_to_au = np.min( distances_h1_to_au )
-			min_h2_distance_to_au = np.min( distances_h2_to_au )
-
-			closest_au1_idx = au_indices[ np.argmin(distances_h1_to_au ) ]
-			closest_au2_idx = au_indices[ np.argmin(distances_h2_to_au ) ]
-
-			n_attached_h_distances = {}
-			for h_idx in [h4_nh3_idx, h5_nh3_idx, h6_nh3_idx]:
-				distances_to_au = cdist( [ system.positions[ h_idx ] ], au_positions ).flatten()
-				min_distance_to_au = np.min( distances_to_au )
-				closest_au_idx = au_indices[ np.argmin(distances_to_au ) ]
-				n_attached_h_distances[f"H-Au"] = f"{h_idx} - {closest_au_idx} = {round(min_distance_to_au, 3)}"
+		for k in np.flatnonzero( N_O[ row ] <= distance_threshold ):
+			h1_idx, o_idx, h2_idx = ( int( i ) for i in H2O[ k ] )
+			closest_au1_idx, closest_au2_idx = ( int( i ) for i in closest_au[ k ] )
+			min_h1_distance_to_au, min_h2_distance_to_au = au_distances[ k ]
 
 			molecule_results.append({
 				"[C, H1, H2, H3, N, H4, H5, H6]": [c_idx, h1_nh3_idx, h2_nh3_idx, h3_nh3_idx, n_idx, h4_nh3_idx, h5_nh3_idx, h6_nh3_idx],
 				"[H1, O, H2]": [h1_idx, o_idx, h2_idx],
 				"H1-Au1": f"{h1_idx} - {closest_au1_idx} = {round(min_h1_distance_to_au, 3)}",
 				"H2-Au2": f"{h2_idx} - {closest_au2_idx} = {round(min_h2_distance_to_au, 3)}",
-				"N-O Distance": round(distance_n_to_o, 3)
+				"N-O Distance": round(N_O[ row, k ], 3)
 			})
 
 		molecule_results.sort( key=lambda x: x[ "N-O Distance" ] )
@@ -503,40 +502,8 @@ def get_CH3NH3_hydration_shell(poscar, H2O_mols, CH3NH3_molecules, distance_thre
 #H2O molecules that not belong to CH3NH3 hydration shel
 #H2O -> OH + H*
 def get_non_CH3NH3_hydration_shell(poscar, H2O_mols, CH3NH3_molecules, distance_threshold = 3.2, verbose = False ):
-	system = read( poscar )
-	au_indices = [ i for i, atom in enumerate( system ) if atom.symbol == "Au" ]
-	au_positions = system.positions[ au_indices ]
-
-	non_hydration_H2O = list()
-
-	for h2o in H2O_mols:
-		h1_idx, o_idx, h2_idx = h2o
-		is_in_hydration_shell = False
-
-		for ch3nh3 in CH3NH3_molecules:
-			n_idx, h1_ch3nh3, h2_ch3nh3, h3_ch3nh3, c_idx, h4_ch3nh3, h5_ch3nh3, h6_ch3nh3 = ch3nh3
-
-			distance_n_to_o = np.linalg.norm( system.positions[ n_idx ] - system.positions[ o_idx ] )
-
-			if distance_n_to_o <= distance_threshold:
-				is_in_hydration_shell = True
-				break
-
-		if not is_in_hydration_shell:
-			distances_h1_to_au = cdist( [ system.positions[ h1_idx ] ], au_positions ).flatten()
-			distances_h2_to_au = cdist( [ system.positions[ h2_idx ] ], au_positions ).flatten()
-
-			closest_au_h1_idx = au_indices[ np.argmin( distances_h1_to_au ) ]
-			closest_au_h2_idx = au_indices[ np.argmin( distances_h2_to_au ) ]
-
-			min_h1_distance_to_au = np.min( distances_h1_to_au )
-			min_h2_distance_to_au = np.min( distances_h2_to_au )
-
-			non_hydration_H2O.append({
-				"H2O": [h1_idx, o_idx, h2_idx],
-				f"{h1_idx}-{closest_au_h1_idx}": round(min_h1_distance_to_au, 3),
-				f"{h2_idx}-{closest_au_h2_idx}": round(min_h2_distance_to_au, 3)
-			})
+	system = get_system( poscar )
+	non_hydration_H2O = get_non_hydration_shell_records( system, H2O_mols, [ ch3nh3[ 0 ] for ch3nh3 in CH3NH3_molecules ], distance_threshold )
 
 	sorted_list = sorted( non_hydration_H2O, key=lambda d: list( d.values() )[ 1 ] )
 	
@@ -563,7 +530,7 @@ def get_non_CH3NH3_hydration_shell(poscar, H2O_mols, CH3NH3_molecules, distance_
 #H2O molecules that belong to NH4 hydration shell
 #For shuttling
 def get_CH3NH3_hydration_shell_shuttling(poscar, H2O_mols, CH3NH3_molecules, distance_threshold = 2.6, verbose = False ):
-	system = read( poscar )
+	system = get_system( poscar )
 	au_indices = [ i for i, atom in enumerate( system ) if atom.symbol == "Au" ]
 	au_positions = system.positions[ au_indices ]
 
@@ -703,18 +670,17 @@ def get_status( path_to_simulation, threshold_distance = 2.2 ):
 		initial_system = read( path_to_simulation + "/POSCAR")
 	else:
 		initial_system = read( path_to_simulation + "/RUN1/POSCAR")
-	au_indices = [ i for i, j in enumerate( system ) if j.symbol == "Au" ]
 	H_info = get_H_from_ICONST( path_to_simulation + "/ICONST" )
 	if isinstance( H_info, int ):
 		H_idx = H_info
-		distance_H_to_Au = [ np.linalg.norm(system.positions[ au_idx ] - system.positions[ H_idx ] ) for au_idx in au_indices ]
-		min_H_Au_dist =  round( min( distance_H_to_Au ), 3 ) 
+		distance_H_to_Au, _ = get_nearest_surface_atom( system, H_idx )
+		min_H_Au_dist =  round( distance_H_to_Au[ 0 ], 3 ) 
 		if min_H_Au_dist < threshold_distance:
 			result = True
 	elif isinstance( H_info, tuple ):
 		O_idx, H_H2O_idx, H_cation_idx = H_info
-		distance_H_to_Au = [ np.linalg.norm( system.positions[ au_idx ] - system.positions[ H_H2O_idx ] ) for au_idx in au_indices ]
-		min_H_Au_dist = round( min( distance_H_to_Au ), 3 )
+		distance_H_to_Au, _ = get_nearest_surface_atom( system, H_H2O_idx )
+		min_H_Au_dist = round( distance_H_to_Au[ 0 ], 3 )
 		distance_O_to_H_cation = np.linalg.norm( system.positions[ O_idx ] - system.positions[ H_cation_idx ] )
 		initial_distance_O_to_H_cation = np.linalg.norm( initial_system.positions[ O_idx ] - initial_system.positions[ H_cation_idx ] )
 		print( "initial dist: ", initial_distance_O_to_H_cation )
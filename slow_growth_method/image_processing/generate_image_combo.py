@@ -5,7 +5,7 @@ from ase.io.trajectory import Trajectory
 from ase.io import read
 import json as js
 import numpy as np
-from figure import get_figure_2
+from figure import get_figures_2, SceneTemplate
 
 os.system("rm -rf frame_*")
 loc = os.getcwd() + "/"
@@ -19,6 +19,8 @@ idx1, idx2, idx3 = data.get_standarized_ICONST_data(loc)
 print(idx1, idx2, idx3)
 
 system = read(loc + '/RUN1/POSCAR')
+# Element table, styles and bond neighbor list, kept between the frames
+template = SceneTemplate()
 
 # Define the rotation angles
 rotations = [ "180z, -60x, 30y", "180z, -60x, 40y", "180z, -60x, 50y", "180z, -60x, 60y", "180z, -60x, 70y",  "180z, -70x, 30y", "180z, -70x, 40y", "180z, -70x, 50y", "180z, -70x, 60y", "180z, -70x, 70y", "180z, -80x, 30y", "180z, -80x, 40y", "180z, -80x, 50y", "180z, -80x, 60y", "180z, -80x, 70y", "180z, -60x, -30y", "180z, -60x, -40y", "180z, -60x, -50y", "180z, -60x, -60y", "180z, -60x, -70y",  "180z, -70x, -30y", "180z, -70x, -40y", "180z, -70x, -50y", "180z, -70x, -60y", "180z, -70x, -70y", "180z, -80x, -30y", "180z, -80x, -40y", "180z, -80x, -50y", "180z, -80x, -60y", "180z, -80x, -70y" ]
@@ -55,9 +57,14 @@ for dir in dirs:
             img.wrap()
             prefix = str(count)
 
+            # All views of the frame share one scene and are rendered in parallel
+            fouts, rots = [], []
             for rot in rotations:
                 rot_filename = rot.replace(", ", "_").replace(" ", "_")
                 fout = f'frame_{prefix}_{rot_filename}'
                 if not os.path.isfile(fout + '.png'):
-                    get_figure_2(img, fout, rot=rot, w=13, h=12)
+                    fouts.append(fout)
+                    rots.append(rot)
+            if fouts:
+                get_figures_2(img, fouts, rots, w=13, h=12, template=template)
             os.system('rm -f *.ini *.pov')
@@ -0,0 +1,101 @@
+import gzip
+import string
+import numpy as np
+from ase import Atoms
+from ase.calculators.singlepoint import SinglePointCalculator
+
+# Bytes counted as printable, as string.printable in fix.py.
+PRINTABLE_BYTES = string.printable.encode( 'ascii' )
+
+# Checks if a line ( bytes ) is binary garbage, i.e. less than threshold of its characters are printable.
+# The non-printable bytes are counted with bytes.translate, which runs in C.
+def is_corrupt( line, threshold = 0.8 ):
+    stripped = line.strip()
+    if not stripped:
+        return False
+    non_printable = len( stripped.translate( None, PRINTABLE_BYTES ) )
+    return ( len( stripped ) - non_printable ) / len( stripped ) < threshold
+
+# Yields the lines of an OUTCAR or OUTCAR.gz ( decompressed on the fly ) as bytes, skipping corrupt lines ( see is_corrupt ).
+# skipped: An optional list; the number of every skipped line ( starting at 1 ) is appended to it.
+def iter_clean_lines( path_to_outcar, skipped = None ):
+    opener = gzip.open if path_to_outcar.endswith( '.gz' ) else open
+    with opener( path_to_outcar, 'rb' ) as f:
+        for n, line in enumerate( f, start = 1 ):
+            if is_corrupt( line ):
+                if skipped is not None:
+                    skipped.append( n )
+                continue
+            yield line
+
+# Returns the element of a POTCAR or TITEL name, e.g. 'H' for b'H_h' or b'Pt_pv_new'.
+def get_species( name ):
+    return name.split( b'_' )[ 0 ].split( b'.' )[ 0 ].decode()
+
+# Matches the species of the header to the counts of "ions per type" and returns the symbol of every atom.
+# titel, potcar: The species of the TITEL and of the POTCAR lines, in order; VASP prints the POTCAR lines twice, so only the first len( counts ) are used.
+def get_symbols( titel, potcar, counts ):
+    if len( titel ) == len( counts ):
+        species = titel
+    elif len( potcar ) >= len( counts ):
+        species = potcar[ :len( counts ) ]
+    else:
+        raise ValueError( "OUTCAR header lists %d species ( TITEL ) and %d ( POTCAR ) for %d ion types" % ( len( titel ), len( potcar ), len( counts ) ) )
+    return [ s for s, c in zip( species, counts ) for _ in range( c ) ]
+
+# Streams the ionic steps of an OUTCAR or OUTCAR.gz in a single pass, without decompressing it to disk or cleaning it first.
+# - The species are taken from the TITEL lines ( or, if they do not match, from the POTCAR lines as ASE does ) and the counts from "ions per type".
+#   A ValueError is raised if neither matches the counts.
+# - A step is emitted at the "FREE ENERGIE OF THE ION-ELECTRON SYSTEM" block that follows its positions, so the energies of the electronic iterations are ignored.
+# - Corrupt lines are skipped wherever they are; a step whose position block cannot be parsed is dropped.
+# path_to_outcar: The path to the OUTCAR or OUTCAR.gz file.
+# maxiter: The maximum number of steps. Default is None ( all ).
+# skipped: See iter_clean_lines. Default is None.
+# Yields: A dictionary per ionic step with "symbols" ( list ), "cell" ( 3x3 ), "positions" and "forces" ( n_atoms x 3 ),
+#         "energy" ( energy(sigma->0) ) and "free_energy" ( TOTEN ), in eV and Angstrom.
+def iread_outcar( path_to_outcar, maxiter = None, skipped = None ):
+    titel, potcar, symbols = [], [], None
+    cell, positions, forces, free_energy, final = None, None, None, None, False
+    lines = iter_clean_lines( path_to_outcar, skipped )
+    count = 0
+    for line in lines:
+        if maxiter is not None and count >= maxiter:
+            return
+        if symbols is None:
+            fields = line.split()
+            if b'TITEL' in line and len( fields ) > 3:
+                titel.append( get_species( fields[ 3 ] ) )
+            elif b'POTCAR:' in line and len( fields ) > 2:
+                potcar.append( get_species( fields[ 2 ] ) )
+            elif b'ions per type' in line:
+                symbols = get_symbols( titel, potcar, [ int( x ) for x in line.split( b'=' )[ 1 ].split() ] )
+            continue
+        if b'direct lattice vectors' in line:
+            try:
+                cell = np.array( [ next( lines ).split()[ :3 ] for _ in range( 3 ) ], dtype = float )
+            except ( ValueError, StopIteration ):
+                cell = None
+        elif b'POSITION' in line and b'TOTAL-FORCE' in line:
+            next( lines, None )
+            try:
+                block = np.array( [ next( lines ).split()[ :6 ] for _ in range( len( symbols ) ) ], dtype = float )
+                positions, forces = block[ :, :3 ], block[ :, 3: ]
+            except ( ValueError, IndexError, StopIteration ):
+                positions, forces = None, None
+        elif b'FREE ENERGIE OF THE ION-ELECTRON SYSTEM' in line:
+            final = True
+        elif b'TOTEN' in line and final:
+            free_energy = float( line.split()[ -2 ] )
+        elif b'energy(sigma->0)' in line and final:
+            if positions is not None and cell is not None:
+                energy = float( line.split()[ -1 ] )
+                yield { 'symbols': symbols, 'cell': cell, 'positions': positions, 'forces': forces, 'energy': energy, 'free_energy': free_energy if free_energy is not None else energy }
+                count += 1
+            positions, forces, free_energy, final = None, None, None, False
+
+# Same as iread_outcar, but yields ASE Atoms with a SinglePointCalculator holding the energies and forces, e.g. for writing MOVIE.traj.
+def iread_outcar_atoms( path_to_outcar, maxiter = None, skipped = None ):
+    for step in iread_outcar( path_to_outcar, maxiter, skipped ):
+        atoms = Atoms( symbols = step[ 'symbols' ], positions = step[ 'positions' ], cell = step[ 'cell' ], pbc = True )
+        atoms.calc = SinglePointCalculator( atoms, energy = step[ 'energy' ], free_energy = step[ 'free_energy' ], forces = step[ 'forces' ] )
+        yield atoms
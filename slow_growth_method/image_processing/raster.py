@@ -0,0 +1,151 @@
+import numpy as np
+from ase.utils import rotate
+
+# A fast preview renderer: draws ball-and-stick images of an Atoms object with NumPy into an RGBA array, without POV-Ray.
+# It follows the conventions of write( ..., format = 'pov' ) as used by figure.get_figure_2:
+# - rotation is ASE's rotation string ( e.g. "180z,-80x" ) and bbox = ( xlo, ylo, xhi, yhi ) is the image plane in Angstrom.
+# - The camera is orthographic and looks along -z of the rotated coordinates.
+# - colors are ( r, g, b ) or ( r, g, b, transmit ) tuples; transmitting atoms are drawn as faint ghosts on top of the others.
+# - bondatoms are ( a, b, offset ) tuples as returned by get_bondpairs. Pairs carrying extra values ( from set_high_bondorder_pairs )
+#   are hydrogen bonds and drawn as dots with the hydrogenbond style ( ndots, color, rdot ).
+# Spheres and bonds are shaded with one directional light and merged with a z-buffer.
+
+LIGHT = np.array( [ -0.4, 0.5, 1.0 ] ) / np.linalg.norm( [ -0.4, 0.5, 1.0 ] )
+HALFWAY = ( LIGHT + np.array( [ 0., 0., 1. ] ) ) / np.linalg.norm( LIGHT + np.array( [ 0., 0., 1. ] ) )
+AMBIENT = 0.35
+SPECULAR = 0.35
+# Opacity of an atom with transmit = 1 ( POV-Ray still shows its highlights ).
+GHOST = 0.25
+
+# Shaded sphere images, by ( radius in pixels, color ); spheres of the same element look the same in every frame.
+STAMPS = { }
+
+# Returns the colors of surface points with unit normals normal ( ..., 3 ) for the base color rgb.
+def shade( normal, rgb ):
+    diffuse = np.clip( normal @ LIGHT, 0., None )
+    specular = SPECULAR * np.clip( normal @ HALFWAY, 0., None ) ** 20
+    return np.clip( np.asarray( rgb[ :3 ] ) * ( AMBIENT + ( 1. - AMBIENT ) * diffuse[ ..., None ] ) + specular[ ..., None ], 0., 1. )
+
+# Returns the image of a sphere centered on a pixel: its half size n, the pixels covered, their height above the center and their colors.
+def get_stamp( r, rgb ):
+    key = ( round( r, 1 ), tuple( rgb[ :3 ] ) )
+    if key not in STAMPS:
+        n = int( np.ceil( r ) )
+        y, x = np.mgrid[ -n:n + 1, -n:n + 1 ]
+        dx = x / r
+        dy = -y / r
+        d2 = dx ** 2 + dy ** 2
+        nz = np.sqrt( np.clip( 1. - d2, 0., None ) )
+        STAMPS[ key ] = ( n, d2 < 1., ( r * nz ).astype( np.float32 ), shade( np.stack( [ dx, dy, nz ], axis = -1 ), rgb ).astype( np.float32 ) )
+    return STAMPS[ key ]
+
+class Canvas:
+    def __init__( self, width, height, background = ( 1., 1., 1., 0. ) ):
+        self.width = width
+        self.height = height
+        self.rgba = np.empty( ( height, width, 4 ), dtype = np.float32 )
+        self.rgba[ :, :, : ] = background
+        self.depth = np.full( ( height, width ), -np.inf, dtype = np.float32 )
+
+    # Returns the pixels of the box x0 < x < x1, y0 < y < y1 as slices and the coordinates of their centers, or None if it is off the canvas.
+    def get_window( self, x0, x1, y0, y1 ):
+        i0 = max( int( np.floor( y0 ) ), 0 )
+        i1 = min( int( np.ceil( y1 ) ) + 1, self.height )
+        j0 = max( int( np.floor( x0 ) ), 0 )
+        j1 = min( int( np.ceil( x1 ) ) + 1, self.width )
+        if i0 >= i1 or j0 >= j1:
+            return None
+        y, x = np.mgrid[ i0:i1, j0:j1 ] + 0.5
+        return ( slice( i0, i1 ), slice( j0, j1 ) ), x, y
+
+    # Writes colors where a primitive is in front of the z-buffer ( or blends them on top if opacity < 1 ).
+    # sl, mask: The pixel window and the pixels covered; z: The depth of the surface; colors: The colors of the pixels of the window.
+    def paint( self, sl, mask, z, colors, opacity = 1. ):
+        depth = self.depth[ sl ]
+        front = mask & ( z > depth )
+        rgba = self.rgba[ sl ]
+        if opacity >= 1.:
+            np.copyto( rgba[ :, :, :3 ], colors, where = front[ :, :, None ] )
+            np.copyto( rgba[ :, :, 3 ], 1., where = front )
+            np.copyto( depth, z, where = front )
+        else:
+            np.copyto( rgba[ :, :, :3 ], ( 1. - opacity ) * rgba[ :, :, :3 ] + opacity * colors, where = front[ :, :, None ] )
+            np.copyto( rgba[ :, :, 3 ], np.maximum( rgba[ :, :, 3 ], opacity ), where = front )
+
+    # A sphere at ( x, y, z ) ( pixel coordinates, z towards the camera ) with radius r, drawn from its stamp on the nearest pixel.
+    def sphere( self, x, y, z, r, rgb, opacity = 1. ):
+        n, mask, height, colors = get_stamp( r, rgb )
+        i = int( np.floor( y ) )
+        j = int( np.floor( x ) )
+        i0, i1 = max( i - n, 0 ), min( i + n + 1, self.height )
+        j0, j1 = max( j - n, 0 ), min( j + n + 1, self.width )
+        if i0 >= i1 or j0 >= j1:
+            return
+        stamp = ( slice( i0 - i + n, i1 - i + n ), slice( j0 - j + n, j1 - j + n ) )
+        self.paint( ( slice( i0, i1 ), slice( j0, j1 ) ), mask[ stamp ], z + height[ stamp ], colors[ stamp ], opacity )
+
+    # A cylinder from p0 to p1 ( pixel coordinates, z towards the camera ), colored rgb0 on the first half and rgb1 on the second.
+    def cylinder( self, p0, p1, r, rgb0, rgb1 ):
+        d = p1[ :2 ] - p0[ :2 ]
+        length2 = d @ d
+        if length2 < 1e-12:
+            return
+        window = self.get_window( min( p0[ 0 ], p1[ 0 ] ) - r, max( p0[ 0 ], p1[ 0 ] ) + r, min( p0[ 1 ], p1[ 1 ] ) - r, max( p0[ 1 ], p1[ 1 ] ) + r )
+        if window is None:
+            return
+        sl, px, py = window
+        t = ( ( px - p0[ 0 ] ) * d[ 0 ] + ( py - p0[ 1 ] ) * d[ 1 ] ) / length2
+        inside = ( t >= 0. ) & ( t <= 1. )
+        ex = ( px - p0[ 0 ] - t * d[ 0 ] ) / r
+        ey = ( p0[ 1 ] + t * d[ 1 ] - py ) / r
+        e2 = ex ** 2 + ey ** 2
+        mask = inside & ( e2 < 1. )
+        nz = np.sqrt( np.clip( 1. - e2, 0., None ) )
+        z = p0[ 2 ] + t * ( p1[ 2 ] - p0[ 2 ] ) + r * nz
+        normal = np.stack( [ ex, ey, nz ], axis = -1 )
+        self.paint( sl, mask & ( t < 0.5 ), z, shade( normal, rgb0 ), 1. )
+        self.paint( sl, mask & ( t >= 0.5 ), z, shade( normal, rgb1 ), 1. )
+
+# Renders atoms ( see the conventions above ) and returns the image as a ( height, width, 4 ) float32 array in [ 0, 1 ].
+# atoms: The Atoms object.
+# radii, colors: Per-atom lists, as passed to write( ..., format = 'pov' ).
+# bondatoms: The bond pairs. Default is no bonds.
+# bbox: The image plane ( xlo, ylo, xhi, yhi ) in Angstrom.
+# rotation: An ASE rotation string or a 3x3 matrix. Default is ''.
+# canvas_width: The width in pixels. Default is 1000.
+# bondlinewidth: The bond radius in Angstrom. Default is 0.10, as in ase.io.pov.
+# hydrogenbond: The style of the hydrogen bonds: { 'ndots', 'color', 'rdot' }. Default is None, which draws them as normal bonds.
+def render_raster( atoms, radii, colors, bondatoms = [ ], bbox = None, rotation = '', canvas_width = 1000, bondlinewidth = 0.10, hydrogenbond = None ):
+    matrix = rotate( rotation ) if isinstance( rotation, str ) else np.asarray( rotation )
+    positions = atoms.positions @ matrix
+    scale = canvas_width / ( bbox[ 2 ] - bbox[ 0 ] )
+    height = int( round( ( bbox[ 3 ] - bbox[ 1 ] ) * scale ) )
+    canvas = Canvas( canvas_width, height )
+
+    # pixel coordinates: x to the right, y downwards, z ( depth ) towards the camera
+    def to_pixels( p ):
+        return np.stack( [ ( p[ ..., 0 ] - bbox[ 0 ] ) * scale, ( bbox[ 3 ] - p[ ..., 1 ] ) * scale, p[ ..., 2 ] * scale ], axis = -1 )
+
+    pixels = to_pixels( positions )
+    radii = np.asarray( radii ) * scale
+    transmit = np.array( [ c[ 3 ] if len( c ) > 3 else 0. for c in colors ] )
+
+    for a in np.where( transmit == 0. )[ 0 ]:
+        canvas.sphere( pixels[ a, 0 ], pixels[ a, 1 ], pixels[ a, 2 ], radii[ a ], colors[ a ] )
+
+    cell = atoms.cell.array
+    for pair in bondatoms:
+        a, b, offset = pair[ 0 ], pair[ 1 ], pair[ 2 ]
+        end = to_pixels( ( atoms.positions[ b ] + np.asarray( offset ) @ cell ) @ matrix )
+        if len( pair ) > 3 and hydrogenbond is not None:
+            for t in np.arange( 1, hydrogenbond[ 'ndots' ] + 1 ) / ( hydrogenbond[ 'ndots' ] + 1. ):
+                dot = ( 1. - t ) * pixels[ a ] + t * end
+                canvas.sphere( dot[ 0 ], dot[ 1 ], dot[ 2 ], hydrogenbond[ 'rdot' ] * scale, hydrogenbond[ 'color' ] )
+        else:
+            canvas.cylinder( pixels[ a ], end, bondlinewidth * scale, colors[ a ], colors[ b ] )
+
+    # transmitting atoms last, from the back to the front
+    for a in np.argsort( pixels[ :, 2 ] ):
+        if transmit[ a ] > 0.:
+            canvas.sphere( pixels[ a, 0 ], pixels[ a, 1 ], pixels[ a, 2 ], radii[ a ], colors[ a ], 1. - ( 1. - GHOST ) * transmit[ a ] )
+    return canvas.rgba
@@ -0,0 +1,49 @@
+import os
+import glob
+import numpy as np
+from ase.io import read
+
+# Returns the absolute path of the ICONST file of a SG simulation.
+# path_to_SG_simulation: The path to the SG simulation directory.
+# Returns: RUN1/ICONST if it exists, otherwise the ICONST file in the simulation directory itself.
+def get_ICONST_path( path_to_SG_simulation ):
+	path_to_SG_simulation = os.path.abspath( path_to_SG_simulation )
+	iconst_path = os.path.join( path_to_SG_simulation, "RUN1", "ICONST" )
+	if not os.path.isfile( iconst_path ):
+		iconst_path = os.path.join( path_to_SG_simulation, "ICONST" )
+	return iconst_path
+
+# Holds everything the distance and molecule helpers need from one simulation directory, read only once.
+# - path: The absolute path to the simulation directory.
+# - runs: The RUN directories, sorted numerically.
+# - system: The initial structure (RUN1/POSCAR, or POSCAR if there are no RUN directories). It is shared, do not modify it.
+# - iconst_lines: The lines of the ICONST file (see get_ICONST_path), right-stripped.
+# - indices: A dictionary mapping every element symbol of the system to a NumPy array with its atom indices.
+class SimulationContext:
+	def __init__( self, path_to_SG_simulation ):
+		self.path = os.path.abspath( path_to_SG_simulation )
+		runs = glob.glob( os.path.join( self.path, "RUN*" ) )
+		runs.sort( key = lambda x: int( os.path.basename( x ).replace( "RUN", "" ) ) )
+		self.runs = runs
+		if not runs:
+			self.system = read( os.path.join( self.path, "POSCAR" ) )
+		else:
+			self.system = read( os.path.join( self.path, "RUN1", "POSCAR" ) )
+		with open( get_ICONST_path( self.path ) ) as file:
+			self.iconst_lines = [ line.rstrip() for line in file ]
+		symbols = np.array( self.system.get_chemical_symbols() )
+		self.indices = { element: np.flatnonzero( symbols == element ) for element in np.unique( symbols ) }
+
+	# Returns a NumPy array with the indices of all atoms of the given element (empty if there are none).
+	def get_indices( self, element ):
+		return self.indices.get( element, np.empty( 0, dtype = int ) )
+
+	def __repr__( self ):
+		return f"SimulationContext( {self.path}, {len( self.system )} atoms, {len( self.runs )} RUNs )"
+
+# Returns a SimulationContext for the given source.
+# source: Either an existing SimulationContext (returned unchanged) or a path to a simulation directory.
+def get_simulation_context( source ):
+	if isinstance( source, SimulationContext ):
+		return source
+	return SimulationContext( source )
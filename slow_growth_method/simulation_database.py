@@ -0,0 +1,207 @@
+import os
+import json
+import sqlite3
+
+# Columns stored for every entry besides its category and name. Keys of an entry that are not listed here are kept in the "extra" column as JSON.
+# - path, note: as in database_for_theo.js.
+# - fingerprint: the list written by build_database_for_theo_v2.get_fingerprint, stored as JSON.
+# - barrier, D_H_Au, I_H_Au, D_O_cation, Min_D_O_H, Init_D_O_H: derived metrics, NULL until they are computed.
+# - provenance: hash of the input files the derived metrics were computed from ( see get_data_optimized_v2.get_provenance_hash ).
+# - metrics: the full record of the derived metrics as written by get_data_optimized_v2.get_barrier_from_db, stored as JSON.
+ENTRY_COLUMNS = ( "path", "note", "fingerprint", "barrier", "D_H_Au", "I_H_Au", "D_O_cation", "Min_D_O_H", "Init_D_O_H", "provenance", "metrics" )
+JSON_COLUMNS = ( "fingerprint", "metrics" )
+METRIC_COLUMNS = ( "barrier", "D_H_Au", "I_H_Au", "D_O_cation", "Min_D_O_H", "Init_D_O_H" )
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (
+	category TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS entries (
+	category TEXT NOT NULL REFERENCES categories( category ),
+	name TEXT NOT NULL,
+	path TEXT NOT NULL,
+	note TEXT,
+	fingerprint TEXT,
+	barrier REAL,
+	D_H_Au REAL,
+	I_H_Au TEXT,
+	D_O_cation REAL,
+	Min_D_O_H REAL,
+	Init_D_O_H REAL,
+	provenance TEXT,
+	metrics TEXT,
+	extra TEXT,
+	PRIMARY KEY ( category, name )
+);
+CREATE INDEX IF NOT EXISTS entries_note_barrier ON entries ( category, note, barrier );
+"""
+
+# An SQLite store for the simulation database, a drop-in replacement for the dictionary kept in database_for_theo.js.
+# Reading works like the dictionary: store.keys() lists the categories and store[ category ] returns { name: entry } for that category only,
+# so get_barrier_from_db and the builder can use either. Writes go through add_category, upsert and upsert_many and are committed with commit().
+# path_to_database: The SQLite file, created if it does not exist.
+class SimulationDatabase:
+	def __init__( self, path_to_database ):
+		self.path = os.path.abspath( path_to_database )
+		self.connection = sqlite3.connect( self.path )
+		self.connection.row_factory = sqlite3.Row
+		self.connection.executescript( SCHEMA )
+		#stores created before the provenance and metrics columns existed
+		existing = [ row[ "name" ] for row in self.connection.execute( "PRAGMA table_info( entries )" ) ]
+		for column in ( "provenance", "metrics" ):
+			if column not in existing:
+				self.connection.execute( "ALTER TABLE entries ADD COLUMN %s TEXT" % ( column ) )
+
+	def __repr__( self ):
+		return f"SimulationDatabase( {self.path}, {len( self.keys() )} categories )"
+
+	def __contains__( self, category ):
+		return self.connection.execute( "SELECT 1 FROM categories WHERE category = ?", ( category, ) ).fetchone() is not None
+
+	def __getitem__( self, category ):
+		if category not in self:
+			raise KeyError( category )
+		rows = self.connection.execute( "SELECT * FROM entries WHERE category = ? ORDER BY name", ( category, ) )
+		return { row[ "name" ]: self.row_to_entry( row ) for row in rows }
+
+	# Adds a category and upserts its entries, e.g. store[ key ] = {} as done by db_add_key.
+	def __setitem__( self, category, entries ):
+		self.upsert_many( category, entries, commit = False )
+
+	def keys( self ):
+		return [ row[ 0 ] for row in self.connection.execute( "SELECT category FROM categories ORDER BY category" ) ]
+
+	def items( self ):
+		return [ ( category, self[ category ] ) for category in self.keys() ]
+
+	def add_category( self, category ):
+		self.connection.execute( "INSERT OR IGNORE INTO categories ( category ) VALUES ( ? )", ( category, ) )
+
+	# Returns the entry as a dictionary, or None if it does not exist.
+	def get( self, category, name ):
+		row = self.connection.execute( "SELECT * FROM entries WHERE category = ? AND name = ?", ( category, name ) ).fetchone()
+		if row is None:
+			return None
+		return self.row_to_entry( row )
+
+	# Inserts or replaces one entry. The change is part of the current transaction until commit() is called.
+	def upsert( self, category, name, entry ):
+		self.upsert_many( category, { name: entry }, commit = False )
+
+	# Inserts or replaces several entries of one category with a single executemany.
+	# entries: A dictionary { name: entry }.
+	# commit: If True, the entries are written in their own transaction. Default is True.
+	def upsert_many( self, category, entries, commit = True ):
+		self.add_category( category )
+		columns = ( "category", "name" ) + ENTRY_COLUMNS + ( "extra", )
+		statement = "INSERT OR REPLACE INTO entries ( %s ) VALUES ( %s )" % ( ", ".join( columns ), ", ".join( [ "?" ] * len( columns ) ) )
+		self.connection.executemany( statement, [ ( category, name ) + self.entry_to_row( entry ) for name, entry in entries.items() ] )
+		if commit:
+			self.commit()
+
+	# Returns entries as a list of dictionaries with their "category" and "name" added, using the ( category, note, barrier ) index.
+	# category: A category name or a glob pattern such as "3_CH3NH3*". None selects every category.
+	#           A name of an existing category is matched exactly, so names containing "*", "?" or "[" select only their own entries.
+	# note: Only entries with this note, e.g. "Good". None selects every note.
+	# order_by: An entry column to sort by, e.g. "barrier". Default is the category and the name.
+	# descending: Sort in descending order. Default is False.
+	def query( self, category = None, note = None, order_by = None, descending = False ):
+		conditions, parameters = [], []
+		if category is not None:
+			conditions.append( "category = ?" if category in self else "category GLOB ?" )
+			parameters.append( category )
+		if note is not None:
+			conditions.append( "note = ?" )
+			parameters.append( note )
+		statement = "SELECT * FROM entries"
+		if conditions:
+			statement += " WHERE " + " AND ".join( conditions )
+		if order_by is not None:
+			if order_by not in ( "category", "name" ) + ENTRY_COLUMNS:
+				raise ValueError( "Unsupported column. Supported columns are: " + ", ".join( ( "category", "name" ) + ENTRY_COLUMNS ) )
+			statement += " ORDER BY %s %s" % ( order_by, "DESC" if descending else "ASC" )
+		else:
+			statement += " ORDER BY category, name"
+		entries = list()
+		for row in self.connection.execute( statement, parameters ):
+			entry = self.row_to_entry( row )
+			entry[ "category" ] = row[ "category" ]
+			entry[ "name" ] = row[ "name" ]
+			entries.append( entry )
+		return entries
+
+	# Stores the derived metrics of an entry without touching its path, note and fingerprint.
+	# provenance: The provenance hash of the input files.
+	# metrics: The full record, stored as JSON.
+	# columns: Values for METRIC_COLUMNS ( missing ones are set to NULL ).
+	def set_metrics( self, category, name, provenance, metrics, columns ):
+		assignments = [ "provenance = ?", "metrics = ?" ] + [ "%s = ?" % ( column ) for column in METRIC_COLUMNS ]
+		parameters = [ provenance, json.dumps( metrics, default = to_json ) ] + [ columns.get( column ) for column in METRIC_COLUMNS ]
+		self.connection.execute( "UPDATE entries SET %s WHERE category = ? AND name = ?" % ( ", ".join( assignments ) ), parameters + [ category, name ] )
+
+	def delete( self, category, name ):
+		self.connection.execute( "DELETE FROM entries WHERE category = ? AND name = ?", ( category, name ) )
+
+	# Removes every category and entry.
+	def clear( self ):
+		self.connection.execute( "DELETE FROM entries" )
+		self.connection.execute( "DELETE FROM categories" )
+
+	def commit( self ):
+		self.connection.commit()
+
+	def close( self ):
+		self.connection.commit()
+		self.connection.close()
+
+	# Imports a JSON database ( database_for_theo.js ) in one transaction.
+	def import_json( self, fin ):
+		with open( fin, "r" ) as f:
+			database = json.load( f )
+		for category, entries in database.items():
+			self.upsert_many( category, entries, commit = False )
+		self.commit()
+
+	# Writes the store as a JSON database in the format of database_for_theo.js, for scripts that still read the JSON file.
+	def export_json( self, fout ):
+		with open( fout, "w" ) as f:
+			json.dump( dict( self.items() ), f, indent = 4 )
+
+	@staticmethod
+	def entry_to_row( entry ):
+		row = list()
+		for column in ENTRY_COLUMNS:
+			value = entry.get( column )
+			if column in JSON_COLUMNS and value is not None:
+				value = json.dumps( value, default = to_json )
+			row.append( value )
+		extra = { key: value for key, value in entry.items() if key not in ENTRY_COLUMNS }
+		row.append( json.dumps( extra ) if extra else None )
+		return tuple( row )
+
+	@staticmethod
+	def row_to_entry( row ):
+		entry = dict()
+		for column in ENTRY_COLUMNS:
+			value = row[ column ]
+			if value is None and column not in ( "path", "note" ):
+				continue
+			if column in JSON_COLUMNS:
+				value = json.loads( value )
+			entry[ column ] = value
+		if row[ "extra" ]:
+			entry.update( json.loads( row[ "extra" ] ) )
+		return entry
+
+# Converts NumPy scalars, which json cannot serialize, to Python numbers.
+def to_json( value ):
+	if hasattr( value, "item" ):
+		return value.item()
+	raise TypeError( "%s is not JSON serializable" % ( type( value ).__name__ ) )
+
+# Opens a database file: a SimulationDatabase for SQLite files ( .db, .sqlite ), otherwise the JSON file loaded as a dictionary.
+def open_database( database_file ):
+	if os.path.splitext( database_file )[ 1 ] in ( ".db", ".sqlite" ):
+		return SimulationDatabase( database_file )
+	with open( database_file, "r" ) as f:
+		return json.load( f )
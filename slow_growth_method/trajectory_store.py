@@ -0,0 +1,115 @@
+import os
+import json
+import numpy as np
+from ase import Atoms
+from ase.io.trajectory import Trajectory
+
+# Files of the position store written next to MOVIE.traj in every RUN directory.
+# - STORE_POSITIONS: float32 array of shape ( n_frames, n_atoms, 3 ), read memory-mapped.
+# - STORE_CELLS: float64 array of shape ( n_frames, 3, 3 ).
+# - STORE_META: atomic numbers, pbc, number of frames and the fingerprint of the trajectory the store was built from.
+STORE_POSITIONS = "MOVIE_positions.npy"
+STORE_CELLS = "MOVIE_cells.npy"
+STORE_META = "MOVIE_meta.json"
+
+# Returns the fingerprint (file name, size in bytes, modification time in ns) of a trajectory file.
+def get_source_fingerprint( path_to_source ):
+	stat = os.stat( path_to_source )
+	return [ os.path.basename( path_to_source ), stat.st_size, stat.st_mtime_ns ]
+
+# Checks if the position store of a RUN directory exists and was built from the current trajectory file.
+# path_to_run: The path to the RUN directory.
+# source: The name of the trajectory file in the RUN directory. Default is "MOVIE.traj".
+def is_store_up_to_date( path_to_run, source = "MOVIE.traj" ):
+	meta_path = os.path.join( path_to_run, STORE_META )
+	source_path = os.path.join( path_to_run, source )
+	if not os.path.isfile( meta_path ) or not os.path.isfile( os.path.join( path_to_run, STORE_POSITIONS ) ):
+		return False
+	if not os.path.isfile( source_path ):
+		return True
+	with open( meta_path, "r" ) as f:
+		meta = json.load( f )
+	return meta.get( "source" ) == get_source_fingerprint( source_path )
+
+# Writes the position store of one RUN directory from its trajectory file.
+# - The frames are streamed into a memory-mapped .npy file, so only one frame is held in memory.
+# - The files are written under temporary names and renamed at the end; the metadata is renamed last, so an interrupted conversion is never taken as up to date.
+# path_to_run: The path to the RUN directory.
+# source: The name of the trajectory file in the RUN directory. Default is "MOVIE.traj".
+# force: If True, the store is rebuilt even if it is up to date. Default is False.
+# Returns: The path to the RUN directory.
+def convert_trajectory( path_to_run, source = "MOVIE.traj", force = False ):
+	path_to_run = os.path.abspath( path_to_run )
+	if not force and is_store_up_to_date( path_to_run, source ):
+		return path_to_run
+	source_path = os.path.join( path_to_run, source )
+	traj = Trajectory( source_path, "r" )
+	n_frames = len( traj )
+	# a RUN that has just started has no finished ionic step yet; its store is empty, shape ( 0, 0, 3 )
+	first = traj[ 0 ] if n_frames else Atoms()
+	positions_tmp = os.path.join( path_to_run, STORE_POSITIONS + ".tmp" )
+	cells_tmp = os.path.join( path_to_run, STORE_CELLS + ".tmp" )
+	positions = np.lib.format.open_memmap( positions_tmp, mode = "w+", dtype = np.float32, shape = ( n_frames, len( first ), 3 ) )
+	cells = np.empty( ( n_frames, 3, 3 ) )
+	for i, atoms in enumerate( traj ):
+		positions[ i ] = atoms.positions
+		cells[ i ] = atoms.cell.array
+	traj.close()
+	positions.flush()
+	del positions
+	with open( cells_tmp, "wb" ) as f:
+		np.save( f, cells )
+	meta = { "numbers": first.numbers.tolist(), "pbc": first.pbc.tolist(), "n_frames": n_frames, "source": get_source_fingerprint( source_path ) }
+	os.replace( positions_tmp, os.path.join( path_to_run, STORE_POSITIONS ) )
+	os.replace( cells_tmp, os.path.join( path_to_run, STORE_CELLS ) )
+	with open( os.path.join( path_to_run, STORE_META + ".tmp" ), "w" ) as f:
+		json.dump( meta, f )
+	os.replace( os.path.join( path_to_run, STORE_META + ".tmp" ), os.path.join( path_to_run, STORE_META ) )
+	return path_to_run
+
+# Read-only access to the position store of one RUN directory.
+# - positions: The memory-mapped float32 array of shape ( n_frames, n_atoms, 3 ). Slices such as positions[ ::25 ] or positions[ :, idx ] do not copy.
+# - cells: A float64 array of shape ( n_frames, 3, 3 ).
+# - numbers, symbols, pbc: The atomic numbers, chemical symbols and periodic boundary conditions, the same for every frame.
+# path_to_run: The path to the RUN directory.
+# source: The name of the trajectory file in the RUN directory. Default is "MOVIE.traj".
+# convert: If True, the store is (re)built with convert_trajectory when it is missing or out of date. Default is True.
+class TrajectoryStore:
+	def __init__( self, path_to_run, source = "MOVIE.traj", convert = True ):
+		self.path = os.path.abspath( path_to_run )
+		if convert and os.path.isfile( os.path.join( self.path, source ) ):
+			convert_trajectory( self.path, source )
+		with open( os.path.join( self.path, STORE_META ), "r" ) as f:
+			meta = json.load( f )
+		self.positions = np.load( os.path.join( self.path, STORE_POSITIONS ), mmap_mode = "r" )
+		self.cells = np.load( os.path.join( self.path, STORE_CELLS ) )
+		self.numbers = np.array( meta[ "numbers" ] )
+		self.pbc = np.array( meta[ "pbc" ] )
+		self.symbols = Atoms( numbers = self.numbers ).get_chemical_symbols()
+
+	def __len__( self ):
+		return len( self.positions )
+
+	def __repr__( self ):
+		return f"TrajectoryStore( {self.path}, {self.positions.shape[ 0 ]} frames, {self.positions.shape[ 1 ]} atoms )"
+
+	# Returns frame i as an ASE Atoms object ( float64 positions ), e.g. for rendering.
+	def get_atoms( self, i ):
+		return Atoms( numbers = self.numbers, positions = self.positions[ i ], cell = self.cells[ i ], pbc = self.pbc )
+
+	# Returns the positions of every step-th frame from start on, as a view of the memory map.
+	def get_frames( self, start = 0, step = 1 ):
+		return self.positions[ start::step ]
+
+	# Returns the positions of one atom over all frames, shape ( n_frames, 3 ), as a view of the memory map.
+	def get_atom_positions( self, idx ):
+		return self.positions[ :, idx ]
+
+# Returns a TrajectoryStore for every RUN directory of a simulation with at least one frame, sorted numerically.
+# path_to_simulation: The path to the simulation directory containing the RUN directories.
+# convert: See TrajectoryStore. Default is True.
+def get_trajectory_stores( path_to_simulation, convert = True ):
+	runs = [ x for x in os.listdir( path_to_simulation ) if x.startswith( "RUN" ) and x[ 3: ].isdigit() and os.path.isdir( os.path.join( path_to_simulation, x ) ) ]
+	runs.sort( key = lambda x: int( x[ 3: ] ) )
+	stores = [ TrajectoryStore( os.path.join( path_to_simulation, run ), convert = convert ) for run in runs ]
+	return [ store for store in stores if len( store ) ]